@@ -10,7 +10,13 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    # Not used by the app; leaving them out keeps the bundle small and quick to load
+    excludes=[
+        'pandas.tests', 'pandas.io.formats.style', 'pandas.io.formats.style_render',
+        'pandas.plotting._matplotlib', 'pandas.io.sas.sas7bdat', 'pandas.io.sas.sas_xport',
+        'numpy.tests', 'numpy.f2py', 'numpy.distutils',
+        'matplotlib', 'scipy', 'IPython', 'jinja2', 'pytest', 'openpyxl', 'sqlalchemy', 'tables',
+    ],
     noarchive=False,
     optimize=0,
 )
@@ -25,7 +31,8 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    # UPX-packed DLLs have to be unpacked on every launch
+    upx=False,
     console=False,
     disable_windowed_traceback=False,
     argv_emulation=False,
@@ -38,7 +45,7 @@ coll = COLLECT(
     a.binaries,
     a.datas,
     strip=False,
-    upx=True,
+    upx=False,
     upx_exclude=[],
     name='FaireStockGUI',
 )
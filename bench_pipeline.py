@@ -0,0 +1,194 @@
+"""
+End-to-end benchmark of the Faire -> Lightspeed pipeline against a local
+mock Lightspeed server (mock_lightspeed_server.py). Nothing touches the
+live store.
+
+For every catalog size / order size combination a synthetic catalog is
+loaded into the mock, a Faire order CSV is generated, and the pipeline
+stages are run one by one. Wall time, API requests and peak Python memory
+(growth during the stage) are reported per stage.
+
+Usage:
+    python bench_pipeline.py --catalog-sizes 1000,20000 --order-sizes 10,500 --latency 0.02
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+import pandas as pd
+
+import faireOrderFuncs as funcs
+from mock_lightspeed_server import MockLightspeed
+
+STAGES = ["read", "match", "create", "shell", "lines", "insert"]
+BRANDS = ["Acme Goods", "Blue Sky Candles", "Green Leaf Co", "Paper & Ink", "Northwind"]
+
+
+def build_catalog(mock: MockLightspeed, size: int, seed: int = 1) -> list:
+    """
+    Loads `size` synthetic products spread over a few brands into the mock.
+    Returns (supplier_code, brand name) for every product.
+    """
+    rng = random.Random(seed)
+    brands = {name: mock.add_brand(name) for name in BRANDS}
+    suppliers = {name: mock.add_supplier(name) for name in BRANDS}
+    keys = []
+    for i in range(size):
+        brand_name = rng.choice(BRANDS)
+        code = f"FA-{i:07d}"
+        mock.add_product(f"Product {i}", code, brands[brand_name], suppliers[brand_name], supply_price=5.0)
+        keys.append((code, brand_name))
+    return keys
+
+
+def write_order(path: str, catalog_keys: list, lines: int, missing_ratio: float, brand: str, seed: int = 2):
+    """
+    Writes a Faire order CSV for one brand, with roughly `missing_ratio` of
+    its lines being SKUs that are not in the catalog yet.
+    """
+    rng = random.Random(seed)
+    existing = [code for code, brand_name in catalog_keys if brand_name == brand]
+    rows = []
+    for i in range(lines):
+        if existing and rng.random() >= missing_ratio:
+            sku = rng.choice(existing)
+        else:
+            sku = f"NEW-{seed}-{i:05d}"
+        rows.append({
+            "Order Number": "BENCH-1",
+            "Brand Name": brand,
+            "Product Name": f"Item {sku}",
+            "SKU": sku,
+            "Quantity": rng.randint(1, 12),
+            "Wholesale Price": f"${rng.uniform(2, 80):,.2f}",
+            "Retail Price": f"${rng.uniform(5, 160):,.2f}",
+        })
+    pd.DataFrame(rows).drop_duplicates(subset=["SKU"]).to_csv(path, index=False)
+
+
+class StageTimer:
+    """
+    Records wall time, mock-server requests and peak traced memory per stage.
+    """
+    def __init__(self, mock: MockLightspeed, trace_memory: bool = True):
+        self.mock = mock
+        self.trace_memory = trace_memory
+        self.results = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        requests_before = self.mock.total_requests()
+        baseline = 0
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        # The pipeline prints a line per product/line; keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            yield
+        self.results[name] = {
+            "seconds": round(time.perf_counter() - started, 4),
+            "requests": self.mock.total_requests() - requests_before,
+            # Growth over what was already allocated (the mock's own data included)
+            "peak_mb": round((tracemalloc.get_traced_memory()[1] - baseline) / 2 ** 20, 2) if self.trace_memory else None,
+        }
+
+
+def run_case(catalog_size: int, order_lines: int, args) -> dict:
+    """
+    Runs every pipeline stage once against a fresh mock store and cache.
+    """
+    mock = MockLightspeed(latency=args.latency, rate_limit=args.rate_limit,
+                          retry_after=args.retry_after, page_size=args.page_size)
+    with mock, tempfile.TemporaryDirectory() as scratch:
+        catalog_keys = build_catalog(mock, catalog_size)
+        order_path = os.path.join(scratch, "order.csv")
+        write_order(order_path, catalog_keys, order_lines, args.missing_ratio, BRANDS[0])
+        mock.request_counts.clear()
+
+        funcs.use_cache_dir(os.path.join(scratch, "cache"))
+        funcs.configure_client(base_url=mock.base_url, api_key="bench", backoff=0.05)
+        registry = funcs.new_supplier_brand_registry()
+        timer = StageTimer(mock, trace_memory=not args.no_memory)
+
+        with timer.stage("read"):
+            faire_df, _ = funcs.normalize_faire_order(funcs.read_faire_order(order_path))
+        with timer.stage("match"):
+            existing_df, missing_df, lookup = funcs.resolve_order_products(faire_df, log=lambda _: None)
+        with timer.stage("create"):
+            created = funcs.create_missing_products(missing_df, registry=registry, max_workers=args.workers)
+            combined_df = funcs.combine_product_ids(existing_df, created)
+        with timer.stage("shell"):
+            stock_order = funcs.create_stock_order_shell(location_id="bench-outlet", faire_df=faire_df, registry=registry)
+        with timer.stage("lines"):
+            line_items = funcs.build_stock_order_lines(combined_df)
+        with timer.stage("insert"):
+            result = funcs.add_products_to_stock_order(stock_order["id"], line_items, max_workers=args.workers)
+
+        return {
+            "catalog_size": catalog_size,
+            "order_lines": len(faire_df),
+            "missing": len(missing_df),
+            "lookup_strategy": lookup["strategy"],
+            "lines_added": len(result["added"]),
+            "lines_failed": len(result["failed"]),
+            "total_seconds": round(sum(s["seconds"] for s in timer.results.values()), 4),
+            "total_requests": mock.total_requests(),
+            "status_counts": dict(mock.status_counts),
+            "requests_by_endpoint": dict(mock.request_counts),
+            "stages": timer.results,
+        }
+
+
+def print_case(case: dict):
+    print(f"\ncatalog={case['catalog_size']:>7} order={case['order_lines']:>5} "
+          f"missing={case['missing']:>5} lookup={case['lookup_strategy']:<11} "
+          f"total={case['total_seconds']:.2f}s requests={case['total_requests']}")
+    for name in STAGES:
+        stage = case["stages"][name]
+        peak = f"{stage['peak_mb']:8.2f} MB" if stage["peak_mb"] is not None else "       n/a"
+        print(f"  {name:<7} {stage['seconds']:9.3f}s {stage['requests']:7d} req {peak}")
+
+
+def _int_list(text: str) -> list:
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Faire -> Lightspeed pipeline against a mock server.")
+    parser.add_argument("--catalog-sizes", type=_int_list, default=[1000, 20000, 200000])
+    parser.add_argument("--order-sizes", type=_int_list, default=[10, 200, 2000])
+    parser.add_argument("--missing-ratio", type=float, default=0.2, help="Share of order lines not in the catalog.")
+    parser.add_argument("--latency", type=float, default=0.02, help="Seconds added to each mock request.")
+    parser.add_argument("--rate-limit", type=float, default=0, help="Mock requests per second before 429s (0 = off).")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After seconds sent with a 429.")
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None, help="Concurrency for product creation and line insertion.")
+    parser.add_argument("--no-memory", action="store_true", help="Skip tracemalloc (faster, no peak memory).")
+    parser.add_argument("--json", help="Also write the results to this JSON file.")
+    args = parser.parse_args(argv)
+
+    if not args.no_memory:
+        tracemalloc.start()
+
+    cases = []
+    for catalog_size in args.catalog_sizes:
+        for order_lines in args.order_sizes:
+            case = run_case(catalog_size, order_lines, args)
+            print_case(case)
+            cases.append(case)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"args": vars(args), "cases": cases}, f, indent=2)
+        print(f"\nResults written to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Cold start check for the GUI entry points and the bundled app.
+
+Every measurement runs in a fresh process:
+- gui_import: importing the GUI module, i.e. everything loaded before the
+  window can be created. This should stay far below pipeline_import.
+- pipeline_import: importing faireOrderFuncs (pandas, requests), which the
+  GUI now loads in the background once the window is up.
+- window: launching the GUI (or a built app with --app) with
+  --startup-probe, which closes the window as soon as it has been drawn.
+  Needs a display; skipped when none is available.
+
+Usage:
+    python bench_startup.py --runs 5 --max-seconds 1.0
+    python bench_startup.py --app dist/FaireStockGUI/FaireStockGUI.exe
+Exits with 1 when the median gui_import or window time is over --max-seconds.
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _default_gui() -> str:
+    return "faire_stock_order_gui_mac" if sys.platform == "darwin" else "faire_stock_order_gui"
+
+
+def time_import(module: str) -> float:
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=HERE, capture_output=True, text=True, check=True)
+    return float(out.stdout.strip().splitlines()[-1])
+
+
+def time_window(command: list) -> float:
+    """
+    Wall time until the probed window has been drawn and closed. Uses the
+    time reported by the app when it prints one (not the case for windowed
+    builds without a console).
+    """
+    started = time.perf_counter()
+    out = subprocess.run(command + ["--startup-probe"], cwd=HERE, capture_output=True, text=True, timeout=120)
+    wall = time.perf_counter() - started
+    if out.returncode != 0:
+        raise RuntimeError(out.stderr.strip() or f"exit code {out.returncode}")
+    match = re.search(r"startup_seconds=([\d.]+)", out.stdout)
+    return float(match.group(1)) if match else wall
+
+
+def slowest_imports(module: str, top: int) -> list:
+    """
+    (cumulative seconds, module) for the slowest imports, from -X importtime.
+    """
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                         cwd=HERE, capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        match = re.match(r"import time:\s+\d+\s+\|\s+(\d+) \|\s+(\S+)$", line)
+        if match and match.group(2) not in (module, "site"):
+            rows.append((int(match.group(1)) / 1e6, match.group(2)))
+    return sorted(rows, reverse=True)[:top]
+
+
+def has_display() -> bool:
+    return sys.platform in ("win32", "darwin") or bool(os.environ.get("DISPLAY") or os.environ.get("WAYLAND_DISPLAY"))
+
+
+def _median(func, runs: int) -> float:
+    return statistics.median(func() for _ in range(runs))
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measure the GUI cold start.")
+    parser.add_argument("--gui", default=_default_gui(), help="GUI module to check.")
+    parser.add_argument("--app", help="Built executable to launch instead of the GUI script.")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=0, help="Also list the N slowest imports of the GUI module.")
+    parser.add_argument("--max-seconds", type=float, default=None, help="Fail when the GUI start is slower than this.")
+    args = parser.parse_args(argv)
+
+    results = {}
+    if not args.app:
+        results["gui_import"] = _median(lambda: time_import(args.gui), args.runs)
+        results["pipeline_import"] = _median(lambda: time_import("faireOrderFuncs"), args.runs)
+    if args.app or has_display():
+        command = [os.path.abspath(args.app)] if args.app else [sys.executable, f"{args.gui}.py"]
+        results["window"] = _median(lambda: time_window(command), args.runs)
+    else:
+        print("No display available; skipping the window measurement.")
+
+    for name, seconds in results.items():
+        print(f"{name:<16} {seconds:7.3f}s (median of {args.runs})")
+    if args.top and not args.app:
+        print(f"\nSlowest imports of {args.gui}:")
+        for seconds, module in slowest_imports(args.gui, args.top):
+            print(f"  {seconds:7.3f}s  {module}")
+
+    checked = {name: results[name] for name in ("gui_import", "window") if name in results}
+    if args.max_seconds is not None:
+        slow = {name: s for name, s in checked.items() if s > args.max_seconds}
+        if slow:
+            print("Startup budget exceeded: " + ", ".join(f"{n} {s:.2f}s" for n, s in slow.items())
+                  + f" > {args.max_seconds:.2f}s")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
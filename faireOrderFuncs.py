@@ -1,100 +1,1049 @@
+import numpy as np
 import pandas as pd
 import requests
 import os
+import codecs
+import contextlib
+import contextvars
+import difflib
+import hashlib
+import importlib.util
+import json
+import random
+import re
+import sqlite3
+import sys
+import threading
+import time
+import unicodedata
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
 # Load environment variables
-DRY_RUN = False
-# DRY_RUN = True
 load_dotenv()
+# Default for every dry_run parameter left as None (FAIRE_DRY_RUN=1 to simulate all writes)
+DRY_RUN = os.getenv("FAIRE_DRY_RUN", "0") == "1"
+# DRY_RUN = True
 API_KEY = os.getenv("LS_API_KEY")
 DOMAIN_PREFIX = os.getenv("LS_DOMAIN_PREFIX")  # e.g., 'yourstore'
 OUTLET_ID = os.getenv("OUTLET_ID")
 BASE_URL = f"https://{DOMAIN_PREFIX}.retail.lightspeed.app/api/2.0"
-HEADERS = {
-    "Authorization": f"Bearer {API_KEY}",
-    "Content-Type": "application/json",
-    "Accept": "application/json"
-}
-def get_all_products():
-    url = f"{BASE_URL}/products"
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Accept": "application/json"
-    }
+# Concurrent requests used when creating products
+CREATE_WORKERS = int(os.getenv("FAIRE_CREATE_WORKERS", "4"))
+# Concurrent requests used when adding lines to a stock order
+LINE_WORKERS = int(os.getenv("FAIRE_LINE_WORKERS", "4"))
+# Seconds a saved supplier/brand list stays valid between runs (0 = reload every run)
+REGISTRY_TTL = int(os.getenv("FAIRE_REGISTRY_TTL", "0"))
+# Trigram similarity at which a supplier/brand name becomes a near-match candidate
+NEAR_MATCH_THRESHOLD = float(os.getenv("FAIRE_NEAR_MATCH_THRESHOLD", "0.6"))
+# Edit similarity (difflib ratio of the normalized names) a candidate also needs, so names that
+# merely share a word ('Sunny Days' / 'Sunny Days Studio') are not taken for misspellings
+NEAR_MATCH_EDIT_RATIO = float(os.getenv("FAIRE_NEAR_MATCH_EDIT_RATIO", "0.85"))
+# What to do with a near match: 'error' (stop and report), 'use' (reuse it) or 'create'
+NEAR_MATCH_POLICY = os.getenv("FAIRE_NEAR_MATCH", "error").lower()
+# Set FAIRE_DEBUG_PRODUCTS_CSV to a file path to export the catalog used for matching
+DEBUG_PRODUCTS_CSV = os.getenv("FAIRE_DEBUG_PRODUCTS_CSV")
+# Orders with at most this many unknown SKUs may be resolved with per-SKU searches
+TARGETED_MAX_SKUS = int(os.getenv("FAIRE_TARGETED_MAX_SKUS", "25"))
+# Seconds since the last full sync after which a delta sync is assumed to be long
+INCREMENTAL_MAX_AGE = int(os.getenv("FAIRE_INCREMENTAL_MAX_AGE", str(24 * 3600)))
+# Products per page of the Lightspeed list endpoints, to estimate what a (delta) sync can cost
+CATALOG_PAGE_SIZE = 1000
+# Rows of a Faire export parsed, cleaned and folded at a time (see read_faire_order_lines())
+FAIRE_READ_CHUNKSIZE = int(os.getenv("FAIRE_READ_CHUNKSIZE", "50000"))
+# Where run reports are written (defaults to CACHE_DIR/reports)
+REPORT_DIR = os.getenv("FAIRE_REPORT_DIR")
+# Local cache directory (catalog store etc.)
+CACHE_DIR = os.getenv("FAIRE_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".faire_stock_cache")
+# Sync inventory before a run and warn about reordering items that are well stocked
+INVENTORY_CHECK = os.getenv("FAIRE_INVENTORY_CHECK", "1") != "0"
+# Units on hand at which an ordered item counts as well stocked
+WELL_STOCKED_LEVEL = int(os.getenv("FAIRE_WELL_STOCKED", "10"))
+# Share every order between outlets: "outlet_id=ratio,..." or the path of a CSV split table (see load_outlet_split())
+OUTLET_SPLIT = os.getenv("FAIRE_OUTLET_SPLIT")
+class LightspeedAPIError(RuntimeError):
+    """
+    Raised when a Lightspeed request still fails after all retries.
+    """
+    def __init__(self, response: requests.Response):
+        self.status_code = response.status_code
+        self.text = response.text
+        super().__init__(f"Error {response.status_code} from {response.request.method} {response.url}: {response.text}")
+_ID_SEGMENT = re.compile(r"^(?:\d+|[0-9a-fA-F]{8}-[0-9a-fA-F-]{27,}|[0-9a-fA-F]{16,})$")
+def _endpoint_name(method: str, url: str) -> str:
+    """
+    'GET https://x/api/2.0/consignments/1f0e.../products?after=5' -> 'GET /consignments/{id}/products'
+    """
+    path = urlparse(url).path
+    if "/api/2.0" in path:
+        path = path.split("/api/2.0", 1)[1]
+    segments = ["{id}" if _ID_SEGMENT.match(seg) else seg for seg in path.split("/") if seg]
+    return f"{method} /" + "/".join(segments)
+def _percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+class RunMetrics:
+    """
+    Timings and HTTP statistics for one pipeline run.
+
+    stage() times a pipeline stage (repeated stages add up). While a
+    RunMetrics is active (see start_run_metrics()), every Lightspeed request
+    is recorded per endpoint: count, status codes, bytes and latency.
+    """
+    def __init__(self, name: str = "run"):
+        self.name = name
+        self.started_at = time.time()
+        self.lock = threading.Lock()
+        self.stages = {}
+        self.endpoints = {}
+        self.info = {}
+
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - started)
+
+    def add_time(self, name: str, seconds: float):
+        with self.lock:
+            stage = self.stages.setdefault(name, {"seconds": 0.0, "count": 0})
+            stage["seconds"] += seconds
+            stage["count"] += 1
+
+    def record_request(self, method: str, url: str, status, seconds: float, bytes_sent: int, bytes_received: int):
+        endpoint = _endpoint_name(method, url)
+        with self.lock:
+            stats = self.endpoints.setdefault(endpoint, {
+                "requests": 0, "statuses": defaultdict(int), "bytes_sent": 0, "bytes_received": 0, "latencies": []
+            })
+            stats["requests"] += 1
+            stats["statuses"][str(status)] += 1
+            stats["bytes_sent"] += bytes_sent
+            stats["bytes_received"] += bytes_received
+            stats["latencies"].append(seconds)
+
+    @property
+    def total_requests(self) -> int:
+        with self.lock:
+            return sum(stats["requests"] for stats in self.endpoints.values())
+
+    def report(self) -> dict:
+        """
+        Machine-readable summary of the run.
+        """
+        with self.lock:
+            endpoints = {}
+            for endpoint, stats in sorted(self.endpoints.items()):
+                latencies = sorted(stats["latencies"])
+                endpoints[endpoint] = {
+                    "requests": stats["requests"],
+                    "statuses": dict(stats["statuses"]),
+                    "bytes_sent": stats["bytes_sent"],
+                    "bytes_received": stats["bytes_received"],
+                    "latency_ms": {
+                        "p50": round(_percentile(latencies, 50) * 1000, 1),
+                        "p90": round(_percentile(latencies, 90) * 1000, 1),
+                        "p99": round(_percentile(latencies, 99) * 1000, 1),
+                        "max": round(latencies[-1] * 1000, 1) if latencies else 0.0,
+                    },
+                }
+            return {
+                "name": self.name,
+                "started_at": datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(),
+                "elapsed_seconds": round(time.time() - self.started_at, 3),
+                "stages": {name: {"seconds": round(v["seconds"], 3), "count": v["count"]}
+                           for name, v in self.stages.items()},
+                "requests": sum(e["requests"] for e in endpoints.values()),
+                "endpoints": endpoints,
+                "info": self.info,
+            }
+
+    def write_report(self, directory: str = None) -> str:
+        """
+        Writes report() as JSON under REPORT_DIR and returns the file path.
+        The name carries milliseconds, the process id and a random suffix, so
+        runs in parallel workers or processes never overwrite each other.
+        """
+        directory = directory or REPORT_DIR or os.path.join(CACHE_DIR, "reports")
+        os.makedirs(directory, exist_ok=True)
+        stamp = datetime.fromtimestamp(self.started_at).strftime("%Y%m%d-%H%M%S-%f")[:-3]
+        path = os.path.join(directory, f"{self.name}-{stamp}-{os.getpid()}-{uuid.uuid4().hex[:8]}.json")
+        with open(path, "x", encoding="utf-8") as f:
+            json.dump(self.report(), f, indent=2, default=str)
+        return path
+
+    def summary(self) -> str:
+        """
+        Short human-readable version of report().
+        """
+        report = self.report()
+        slowest = sorted(report["stages"].items(), key=lambda item: item[1]["seconds"], reverse=True)
+        stages = ", ".join(f"{name} {v['seconds']:.1f}s" for name, v in slowest)
+        errors = sum(count for e in report["endpoints"].values()
+                     for status, count in e["statuses"].items() if not status.startswith("2"))
+        return (f"{report['elapsed_seconds']:.1f}s total ({stages}); "
+                f"{report['requests']} API requests, {errors} non-2xx.")
+# Metrics of the run in progress; a context variable so concurrent runs (e.g. the watch daemon) stay separate
+_run_metrics = contextvars.ContextVar("run_metrics", default=None)
+def start_run_metrics(name: str = "run") -> RunMetrics:
+    """
+    Starts recording metrics for a new run in the current context; HTTP
+    requests made from it (including parallel_map() workers) are recorded into it.
+    """
+    metrics = RunMetrics(name)
+    _run_metrics.set(metrics)
+    return metrics
+def get_run_metrics() -> RunMetrics:
+    return _run_metrics.get()
+def parallel_map(func, items: list, max_workers: int) -> list:
+    """
+    executor.map() that keeps results in input order and runs every call in
+    a copy of the caller's context, so run metrics follow the work into threads.
+    """
+    items = list(items)
+    if not items:
+        return []
+    workers = max(1, min(max_workers, len(items)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(contextvars.copy_context().run, func, item) for item in items]
+        return [future.result() for future in futures]
+def record_http_request(method: str, url: str, status, seconds: float, bytes_sent: int, bytes_received: int):
+    metrics = _run_metrics.get()
+    if metrics is not None:
+        metrics.record_request(method, url, status, seconds, bytes_sent, bytes_received)
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+def decode_json_page(chunks, project=None, array_key: str = "data") -> tuple:
+    """
+    Decodes a page like {"data": [...], "version": {...}} from an iterable of
+    byte chunks (e.g. response.iter_content()) without holding the whole
+    body or every full record at once. The elements of `array_key` are
+    decoded one at a time and handed to `project` (e.g.
+    ProductRecord.from_api) as soon as each is complete, so only the
+    projected records are kept. Other top-level fields are decoded as usual.
+
+    Returns:
+        tuple: (list of (projected) records, dict of the other top-level fields)
+    """
+    decoder = json.JSONDecoder()
+    text = codecs.getincrementaldecoder("utf-8")()
+    chunks = iter(chunks)
+    buf, pos, eof = "", 0, False
+
+    def more() -> bool:
+        nonlocal buf, pos, eof
+        if eof:
+            return False
+        chunk = next(chunks, None)
+        if chunk is None:
+            eof = True
+        buf = buf[pos:] + text.decode(chunk or b"", final=eof)
+        pos = 0
+        return True
+
+    def peek() -> str:
+        nonlocal pos
+        while True:
+            pos = _JSON_WHITESPACE.match(buf, pos).end()
+            if pos < len(buf) or not more():
+                return buf[pos:pos + 1]
+
+    def value():
+        nonlocal pos
+        peek()
+        while True:
+            try:
+                obj, end = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if more():
+                    continue
+                raise
+            # A number cut off by the end of a chunk ("3." of "3.25") may go on in the next one
+            if not eof and (end == len(buf) or type(obj) in (int, float) and buf[end] in "0123456789.eE+-"):
+                more()
+                continue
+            pos = end
+            return obj
+
+    def expect(*allowed) -> str:
+        nonlocal pos
+        char = peek()
+        if char not in allowed or not char:
+            raise json.JSONDecodeError(f"Expected one of {' '.join(allowed)}", buf, pos)
+        pos += 1
+        return char
+
+    records, fields = [], {}
+    expect("{")
+    if peek() == "}":
+        return records, fields
+    while True:
+        key = value()
+        expect(":")
+        if key == array_key and peek() == "[":
+            pos += 1
+            if peek() == "]":
+                pos += 1
+            else:
+                while True:
+                    record = value()
+                    records.append(project(record) if project else record)
+                    if expect(",", "]") == "]":
+                        break
+        else:
+            fields[key] = value()
+        if expect(",", "}") == "}":
+            return records, fields
+class LightspeedClient:
+    """
+    Shared HTTP client for the Lightspeed X-Series API.
 
+    Uses one pooled requests.Session so connections (and TLS sessions) are
+    reused, and retries throttled or failed requests with jittered
+    exponential backoff, honouring the Retry-After header on 429s.
+    POSTs are only retried when the server says it did not process them
+    (429/503), so a retry can never create a duplicate product or line.
+    """
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+    POST_RETRY_STATUSES = {429, 503}
+    IDEMPOTENT_METHODS = {"GET", "HEAD", "PUT", "DELETE"}
+    STREAM_CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, base_url: str = None, api_key: str = None, max_retries: int = 5,
+                 backoff: float = 0.5, max_backoff: float = 60.0, pool_size: int = 16, timeout: float = 30.0):
+        self.base_url = (base_url or BASE_URL).rstrip("/")
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.request_count = 0
+        self._count_lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Authorization": f"Bearer {api_key or API_KEY}",
+            "Content-Type": "application/json",
+            "Accept": "application/json"
+        })
+
+    def url(self, path: str) -> str:
+        if path.startswith("http://") or path.startswith("https://"):
+            return path
+        return f"{self.base_url}/{path.lstrip('/')}"
+
+    def _retry_delay(self, attempt: int, response: requests.Response = None) -> float:
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after:
+            try:
+                return min(float(retry_after), self.max_backoff)
+            except ValueError:
+                try:
+                    when = parsedate_to_datetime(retry_after)
+                    return min(max(when.timestamp() - time.time(), 0.0), self.max_backoff)
+                except (TypeError, ValueError):
+                    pass
+        # Full jitter: spread retries out so parallel workers don't stampede
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    def request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """
+        Sends a request, retrying on throttling, server errors and connection
+        problems. Returns the final response, whatever its status.
+        """
+        method = method.upper()
+        idempotent = method in self.IDEMPOTENT_METHODS
+        retry_statuses = self.RETRY_STATUSES if idempotent else self.POST_RETRY_STATUSES
+        kwargs.setdefault("timeout", self.timeout)
+        url = self.url(path)
+
+        for attempt in range(self.max_retries + 1):
+            with self._count_lock:
+                self.request_count += 1
+            started = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                record_http_request(method, url, "error", time.perf_counter() - started, 0, 0)
+                retryable = idempotent or isinstance(e, requests.ConnectTimeout)
+                if not retryable or attempt == self.max_retries:
+                    raise
+                delay = self._retry_delay(attempt)
+                print(f"{method} {url} failed ({e.__class__.__name__}), retrying in {delay:.1f}s")
+                time.sleep(delay)
+                continue
+            record_http_request(
+                method, url, response.status_code, time.perf_counter() - started,
+                len(response.request.body or b""),
+                int(response.headers.get("Content-Length") or 0) or (0 if kwargs.get("stream") else len(response.content))
+            )
+
+            if response.status_code not in retry_statuses or attempt == self.max_retries:
+                return response
+            delay = self._retry_delay(attempt, response)
+            print(f"{method} {url} returned {response.status_code}, retrying in {delay:.1f}s")
+            # Hands a streamed connection back to the pool
+            response.close()
+            time.sleep(delay)
+
+    def get(self, path: str, **kwargs) -> requests.Response:
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path: str, **kwargs) -> requests.Response:
+        return self.request("POST", path, **kwargs)
+
+    def put(self, path: str, **kwargs) -> requests.Response:
+        return self.request("PUT", path, **kwargs)
+
+    def delete(self, path: str, **kwargs) -> requests.Response:
+        return self.request("DELETE", path, **kwargs)
+
+    def paginate(self, path: str, params: dict = None, project=None):
+        """
+        Follows Lightspeed's version-based pagination (?after=version.max).
+        Raises LightspeedAPIError instead of returning a truncated list.
+
+        With `project` (e.g. ProductRecord.from_api) each page is streamed and
+        decoded record by record (decode_json_page()), keeping only the
+        projected records instead of the page's full dicts.
+
+        Yields:
+            tuple: (list of records, version max of the page)
+        """
+        params = dict(params or {})
+        while True:
+            response = self.get(path, params=params, stream=project is not None)
+            with contextlib.closing(response):
+                if response.status_code != 200:
+                    raise LightspeedAPIError(response)
+                if project is None:
+                    data = response.json()
+                    records = data.get("data")
+                else:
+                    records, data = decode_json_page(response.iter_content(self.STREAM_CHUNK_SIZE), project)
+            if not records:
+                break
+
+            # Get the next version-based page
+            max_version = (data.get("version") or {}).get("max")
+            yield records, max_version
+
+            if max_version:
+                params["after"] = max_version
+            else:
+                break
+_client = None
+_client_lock = threading.Lock()
+def is_dry_run(dry_run: bool = None) -> bool:
+    """
+    Resolves a dry_run parameter: None means the module-wide DRY_RUN setting.
+    """
+    return DRY_RUN if dry_run is None else dry_run
+def get_client() -> LightspeedClient:
+    """
+    Returns the shared Lightspeed client, creating it on first use.
+    """
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = LightspeedClient()
+        return _client
+def configure_client(**kwargs) -> LightspeedClient:
+    """
+    Replaces the shared client, e.g. to point at another store or tune retries.
+    Accepts the LightspeedClient constructor arguments.
+    """
+    global _client
+    with _client_lock:
+        _client = LightspeedClient(**kwargs)
+        return _client
+def use_cache_dir(path: str):
+    """
+    Points the local caches at another directory (e.g. a scratch dir for
+    benchmarks) and drops the already opened ones.
+    """
+    global CACHE_DIR, _catalog_cache, _registry, _inventory_snapshot
+    CACHE_DIR = path
+    _catalog_cache = None
+    _registry = None
+    _inventory_snapshot = None
+def iter_product_pages(after=None, include_deleted: bool = False):
+    """
+    Yields one page of Lightspeed products at a time, following the version cursor.
+    Pages are streamed and each product projected into a ProductRecord while decoding.
+
+    Args:
+        after (int): Only return products with a version greater than this.
+        include_deleted (bool): Also return deleted products (needed for delta syncs).
+
+    Yields:
+        tuple: (list of ProductRecords, version max of the page)
+    """
+    params = {}
+    if after:
+        params["after"] = after
+    if include_deleted:
+        params["deleted"] = "true"
+    yield from get_client().paginate("products", params, project=ProductRecord.from_api)
+def get_all_products(after=None):
     products = []
-    while url:
-        response = requests.get(url, headers=headers)
-        if response.status_code != 200:
-            print(f"Error {response.status_code}: {response.text}")
-            break
+    for page, _ in iter_product_pages(after=after):
+        products.extend(page)
+    return products
+def search_products_by_supplier_code(supplier_code: str) -> list:
+    """
+    Looks a single supplier code up with the search endpoint instead of
+    paging through the catalog. The search narrows the candidates; only
+    products whose supplier_code matches under normalize_code() (so case and
+    whitespace variants too, as in the catalog match) are returned, as ProductRecords.
+    """
+    response = get_client().get("search", params={"type": "products", "q": supplier_code})
+    if response.status_code != 200:
+        raise LightspeedAPIError(response)
+    results = response.json().get("data") or []
+    wanted = normalize_code(supplier_code)
+    return [ProductRecord.from_api(p) for p in results
+            if p.get("supplier_code") is not None and normalize_code(p["supplier_code"]) == wanted
+            and not p.get("deleted_at")]
+def lookup_products_targeted(supplier_codes, max_workers: int = None) -> list:
+    """
+    Runs search_products_by_supplier_code() for each distinct code concurrently.
+    Returns every matching ProductRecord.
+    """
+    codes = sorted(set(str(code) for code in supplier_codes))
+    if not codes:
+        return []
+    results = parallel_map(search_products_by_supplier_code, codes, max_workers or CREATE_WORKERS)
+    return [product for products in results for product in products]
+class CompactRecord:
+    """
+    Base for slotted records holding just the fields this tool reads from an
+    API record. A slotted object with a few short strings is a fraction of
+    the size of the nested dict the API returns. .get() works like on the
+    dicts, so code written for API dicts accepts either.
+    """
+    __slots__ = ()
 
-        data = response.json()
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.get(name))
 
-        if not data.get("data"):
-            break
+    def get(self, key: str, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
 
-        products.extend(data["data"])
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.__slots__}
 
-        # Get the next version-based page
-        version = data.get("version", {})
-        if "max" in version:
-            url = f"{BASE_URL}/products?after={version['max']}"
-        else:
-            break
+    def __repr__(self):
+        return f"{type(self).__name__}({self.as_dict()})"
+def _shared(value):
+    # Brand/supplier names and ids repeat across thousands of products; keep one copy of each
+    return sys.intern(value) if isinstance(value, str) else value
+class ProductRecord(CompactRecord):
+    """
+    The product fields the catalog cache and the matcher use, with the
+    brand flattened into brand_id/brand_name.
+    """
+    __slots__ = ("id", "name", "supplier_code", "brand_id", "brand_name", "supplier_id", "version", "deleted_at")
+
+    @classmethod
+    def from_api(cls, product: dict) -> "ProductRecord":
+        brand = product.get("brand") or {}
+        supplier = product.get("supplier") or {}
+        return cls(
+            id=product.get("id"),
+            name=product.get("name"),
+            supplier_code=product.get("supplier_code"),
+            brand_id=_shared(product.get("brand_id") or brand.get("id")),
+            brand_name=_shared(product.get("brand_name") or brand.get("name")),
+            supplier_id=_shared(product.get("supplier_id") or supplier.get("id")),
+            version=product.get("version"),
+            deleted_at=product.get("deleted_at"),
+        )
+class InventoryRecord(CompactRecord):
+    """
+    The inventory fields InventorySnapshot keeps.
+    """
+    __slots__ = ("product_id", "outlet_id", "inventory_level", "version", "deleted_at")
+
+    @classmethod
+    def from_api(cls, record: dict) -> "InventoryRecord":
+        level = record.get("inventory_level")
+        return cls(
+            product_id=record.get("product_id"),
+            outlet_id=_shared(record.get("outlet_id")),
+            inventory_level=record.get("current_amount") if level is None else level,
+            version=record.get("version"),
+            deleted_at=record.get("deleted_at"),
+        )
+def _product_row(product: dict) -> tuple:
+    """
+    Flattens a ProductRecord (or Lightspeed product dict) into a catalog cache row.
+    """
+    brand = product.get("brand") or {}
+    supplier = product.get("supplier") or {}
+    return (
+        product.get("id"),
+        product.get("name"),
+        product.get("supplier_code"),
+        product.get("brand_id") or brand.get("id"),
+        product.get("brand_name") or brand.get("name"),
+        product.get("supplier_id") or supplier.get("id"),
+        product.get("version"),
+    )
+def _keyed_row(row: tuple) -> tuple:
+    """
+    Appends the match key columns to a catalog cache row.
+    """
+    return (*row, *product_key(row[2], row[4]))
+def _columnar_path(base: str) -> str:
+    """
+    Feather (Arrow IPC) when pyarrow is installed, a pandas pickle otherwise.
+    """
+    return base + (".feather" if importlib.util.find_spec("pyarrow") else ".pkl")
+def _write_columnar(df: pd.DataFrame, path: str):
+    """
+    Atomically writes `df` to a file made by _columnar_path(). Feather files
+    are left uncompressed so they can be memory-mapped when read back.
+    """
+    tmp_path = path + ".tmp"
+    if path.endswith(".feather"):
+        df.reset_index(drop=True).to_feather(tmp_path, compression="uncompressed")
+    else:
+        df.to_pickle(tmp_path)
+    os.replace(tmp_path, path)
+def _read_columnar(path: str, columns: list = None) -> pd.DataFrame:
+    """
+    Reads a file written by _write_columnar(), loading only `columns`.
+    Feather files are memory-mapped instead of copied into memory first.
+    """
+    if path.endswith(".feather"):
+        from pyarrow import feather
+        return feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+    df = pd.read_pickle(path)
+    return df[columns] if columns else df
+def _write_json_atomic(path: str, data: dict):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+# Bump when product_key() changes, so cached keys are recomputed
+PRODUCT_KEY_SCHEMA = 1
+# Bytes of the catalog database SQLite may memory-map, so reads skip the page cache copy
+CATALOG_MMAP_BYTES = 256 * 1024 * 1024
+_PRODUCT_INSERT = ("INSERT OR REPLACE INTO products (id, name, supplier_code, brand_id, brand_name, supplier_id, "
+                   "version, code_key, brand_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)")
+class CatalogCache:
+    """
+    Local SQLite copy of the Lightspeed product catalog.
 
-    return products
+    Remembers the last version.max it has seen, so sync() only downloads
+    products changed since the previous run. Products created by this tool
+    are added straight away with add_created_products().
+
+    Every row also stores its normalized match key (product_key()) under an
+    index, kept up to date in the same transaction as the row, so an order is
+    matched with lookup_keys() probes instead of loading the whole catalog.
+
+    This database is the catalog's persistent snapshot: it survives between
+    runs, is memory-mapped, queries read only the columns they need, and keys
+    made under another PRODUCT_KEY_SCHEMA are rebuilt automatically when it
+    is opened. (It replaces the separate columnar snapshot, whose leftover
+    files are removed.)
+    """
+    def __init__(self, path: str = None):
+        self.path = path or os.path.join(CACHE_DIR, f"catalog_{DOMAIN_PREFIX}.sqlite3")
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.conn.execute(f"PRAGMA mmap_size = {CATALOG_MMAP_BYTES}")
+        self._remove_legacy_snapshot()
+        with self._lock, self.conn:
+            self.conn.executescript("""
+                CREATE TABLE IF NOT EXISTS products (
+                    id TEXT PRIMARY KEY,
+                    name TEXT,
+                    supplier_code TEXT,
+                    brand_id TEXT,
+                    brand_name TEXT,
+                    supplier_id TEXT,
+                    version INTEGER,
+                    code_key TEXT,
+                    brand_key TEXT
+                );
+                CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+            """)
+            self._migrate_keys()
+
+    def _remove_legacy_snapshot(self):
+        """
+        Deletes the Feather/pickle frame snapshot older versions kept next to the database.
+        """
+        base = os.path.splitext(self.path)[0]
+        for path in (base + ".feather", base + ".pkl", base + ".snapshot.json"):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                print(f"Could not remove old catalog snapshot {path}: {e}")
+
+    def _migrate_keys(self):
+        """
+        Adds the match key columns to caches made before they existed, and
+        (re)computes the keys when PRODUCT_KEY_SCHEMA has changed.
+        """
+        columns = {row[1] for row in self.conn.execute("PRAGMA table_info(products)")}
+        for column in ("code_key", "brand_key"):
+            if column not in columns:
+                self.conn.execute(f"ALTER TABLE products ADD COLUMN {column} TEXT")
+        self.conn.execute("DROP INDEX IF EXISTS idx_products_code")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_products_key ON products (code_key, brand_key)")
+        # Bookkeeping of the old columnar snapshot
+        self.conn.execute("DELETE FROM meta WHERE key = 'generation'")
+        row = self.conn.execute("SELECT value FROM meta WHERE key = 'key_schema'").fetchone()
+        if row and row[0] == str(PRODUCT_KEY_SCHEMA):
+            return
+        rows = self.conn.execute("SELECT id, supplier_code, brand_name FROM products").fetchall()
+        self.conn.executemany("UPDATE products SET code_key = ?, brand_key = ? WHERE id = ?",
+                              [(*product_key(code, brand), pid) for pid, code, brand in rows])
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('key_schema', ?)",
+                          (str(PRODUCT_KEY_SCHEMA),))
+
+    def __len__(self):
+        with self._lock:
+            return self.conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+
+    def get_meta(self, key: str, default=None):
+        with self._lock:
+            row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key: str, value):
+        with self._lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    @property
+    def version(self):
+        value = self.get_meta("products_version")
+        return int(value) if value else None
+
+    def upsert_products(self, products: list, max_version=None):
+        """
+        Writes a page of products into the cache and removes deleted ones.
+        The version cursor is moved forward in the same transaction.
+        """
+        live = [_keyed_row(_product_row(p)) for p in products if not p.get("deleted_at")]
+        deleted = [(p.get("id"),) for p in products if p.get("deleted_at")]
+        with self._lock, self.conn:
+            self.conn.executemany(_PRODUCT_INSERT, live)
+            if deleted:
+                self.conn.executemany("DELETE FROM products WHERE id = ?", deleted)
+            if max_version:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO meta (key, value) VALUES ('products_version', ?)",
+                    (str(max_version),)
+                )
+
+    def sync(self) -> int:
+        """
+        Fetches products changed since the last sync and stores them.
+        Returns the number of product records downloaded.
+        """
+        return sum(len(page) for page, _ in self.iter_sync())
+
+    def iter_sync(self):
+        """
+        Like sync(), but yields each page after it has been stored. Stopping
+        early is safe: the cursor only moves past pages that were consumed,
+        so the next sync carries on from there.
+        """
+        after = self.version
+        for page, max_version in iter_product_pages(after=after, include_deleted=bool(after)):
+            self.upsert_products(page, max_version)
+            yield page, max_version
+        # Only a sync that reached the end counts as up to date
+        self.set_meta("synced_at", time.time())
+
+    @property
+    def synced_at(self):
+        value = self.get_meta("synced_at")
+        return float(value) if value else None
+
+    def add_created_products(self, records: list):
+        """
+        Stores products created during a run (dicts with 'id', 'supplier_code',
+        'name' and optionally 'brand_name', 'brand_id', 'supplier_id').
+        The version is left empty; the next sync fills it in.
+        """
+        rows = [
+            _keyed_row((r["id"], r.get("name"), r.get("supplier_code"), r.get("brand_id"),
+                        r.get("brand_name") or r.get("Brand Name"), r.get("supplier_id"), None))
+            for r in records if r.get("id")
+        ]
+        with self._lock, self.conn:
+            self.conn.executemany(_PRODUCT_INSERT, rows)
+
+    def lookup_keys(self, keys) -> tuple:
+        """
+        Looks normalized (supplier_code, brand_name) keys (see product_key())
+        up in the persisted key index: a few indexed queries, however large
+        the catalog. When several products share a key the oldest row is used
+        and the clash reported, like build_catalog_index().
+
+        Returns:
+            tuple: (dict {key: product dict with 'id', 'supplier_code',
+                    'brand_name' and 'name'}, conflicts DataFrame)
+        """
+        keys = {key for key in keys if key[0] and key[1]}
+        codes = sorted({code for code, _ in keys})
+        rows = []
+        with self._lock:
+            # Stays under SQLite's bound-parameter limit
+            for start in range(0, len(codes), 500):
+                chunk = codes[start:start + 500]
+                rows.extend(self.conn.execute(
+                    "SELECT code_key, brand_key, id, supplier_code, brand_name, name FROM products "
+                    f"WHERE code_key IN ({', '.join('?' * len(chunk))}) ORDER BY rowid",
+                    chunk
+                ).fetchall())
+        return _index_products(((row[0], row[1]), row[2:]) for row in rows if (row[0], row[1]) in keys)
+
+    def export_csv(self, path: str, chunksize: int = 50000) -> int:
+        """
+        Writes the cached products to a CSV file (for debugging the matcher),
+        streamed from SQLite a chunk at a time. Returns the number of rows.
+        """
+        rows = 0
+        with self._lock:
+            chunks = pd.read_sql_query(
+                "SELECT id, name, supplier_code, brand_id, brand_name, supplier_id, version FROM products",
+                self.conn, chunksize=chunksize
+            )
+            for chunk in chunks:
+                chunk.to_csv(path, mode="a" if rows else "w", header=not rows, index=False)
+                rows += len(chunk)
+        if not rows:
+            pd.DataFrame(columns=['id', 'name', 'supplier_code', 'brand_id', 'brand_name', 'supplier_id',
+                                  'version']).to_csv(path, index=False)
+        return rows
+_catalog_cache = None
+def get_catalog_cache() -> CatalogCache:
+    """
+    Returns the shared catalog cache, opening it on first use.
+    """
+    global _catalog_cache
+    if _catalog_cache is None:
+        _catalog_cache = CatalogCache()
+    return _catalog_cache
+INVENTORY_COLUMNS = ['product_id', 'outlet_id', 'inventory_level', 'version']
+class InventorySnapshot:
+    """
+    Local columnar copy of Lightspeed inventory levels, one row per
+    (product_id, outlet_id).
+
+    sync() follows the inventory version cursor, so after the first download
+    only changed records are fetched. The snapshot is stored as Feather when
+    pyarrow is installed and as a pandas pickle otherwise; the cursor lives in
+    a small JSON file next to it.
+    """
+    def __init__(self, path: str = None):
+        base = path or os.path.join(CACHE_DIR, f"inventory_{DOMAIN_PREFIX}")
+        self.path = _columnar_path(base)
+        self.meta_path = base + ".json"
+        os.makedirs(os.path.dirname(os.path.abspath(base)), exist_ok=True)
+        self._lock = threading.Lock()
+        self.version = None
+        self.synced_at = None
+        self.frame = self._load()
+
+    @staticmethod
+    def _empty() -> pd.DataFrame:
+        index = pd.MultiIndex.from_arrays([pd.Series(dtype="string"), pd.Series(dtype="string")],
+                                          names=['product_id', 'outlet_id'])
+        return pd.DataFrame({'inventory_level': pd.Series(dtype="Int64"), 'version': pd.Series(dtype="Int64")},
+                            index=index)
+
+    def _load(self) -> pd.DataFrame:
+        try:
+            with open(self.meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            df = _read_columnar(self.path)
+        except (OSError, ValueError, ImportError):
+            return self._empty()
+        self.version = meta.get("version")
+        self.synced_at = meta.get("synced_at")
+        return df.set_index(['product_id', 'outlet_id'])
+
+    def save(self):
+        with self._lock:
+            df = self.frame.reset_index()
+            meta = {"version": self.version, "synced_at": self.synced_at, "rows": len(df)}
+        _write_columnar(df, self.path)
+        # The cursor is written last, so a crash in between only means re-fetching a few pages
+        _write_json_atomic(self.meta_path, meta)
+
+    def __len__(self):
+        return len(self.frame)
+
+    def apply_records(self, records: list):
+        """
+        Merges a batch of inventory records (live or deleted) into the snapshot.
+        """
+        if not records:
+            return
+        delta = pd.DataFrame.from_records(
+            [(r.get("product_id"), r.get("outlet_id"), r.get("inventory_level", r.get("current_amount")),
+              r.get("version"), bool(r.get("deleted_at"))) for r in records],
+            columns=INVENTORY_COLUMNS + ['deleted'],
+        ).astype({'product_id': "string", 'outlet_id': "string", 'inventory_level': "Int64", 'version': "Int64"})
+        # Later records for the same key win
+        delta = delta.drop_duplicates(subset=['product_id', 'outlet_id'], keep='last')
+        delta = delta.set_index(['product_id', 'outlet_id'])
+        live = delta.loc[~delta['deleted'], ['inventory_level', 'version']]
+        with self._lock:
+            kept = self.frame.drop(delta.index, errors='ignore')
+            self.frame = pd.concat([kept, live]) if len(kept) else live
+
+    def sync(self) -> int:
+        """
+        Fetches inventory records changed since the last sync and saves the
+        snapshot. Returns the number of records downloaded.
+
+        Pages are collected as compact records and merged in one pass at the
+        end, so a full download costs one merge instead of one per page.
+        """
+        params = {"after": self.version, "deleted": "true"} if self.version else {}
+        records = []
+        version = self.version
+        for batch, max_version in get_client().paginate("inventory", params, project=InventoryRecord.from_api):
+            records.extend(batch)
+            version = max_version or version
+        self.apply_records(records)
+        self.version = version
+        self.synced_at = time.time()
+        self.save()
+        return len(records)
+
+    def get_on_hand(self, product_ids, outlet_id: str) -> pd.Series:
+        """
+        On-hand levels at `outlet_id` for `product_ids`, as an Int64 Series
+        indexed by product id (NA where the snapshot has no record).
+        """
+        ids = pd.Index(pd.Series(list(product_ids), dtype="string").unique(), name='product_id')
+        with self._lock:
+            frame = self.frame
+        try:
+            levels = frame.xs(str(outlet_id), level='outlet_id')['inventory_level']
+        except KeyError:
+            levels = pd.Series(dtype="Int64")
+        return levels.reindex(ids)
+_inventory_snapshot = None
+def get_inventory_snapshot() -> InventorySnapshot:
+    """
+    Returns the shared inventory snapshot, loading it from disk on first use.
+    """
+    global _inventory_snapshot
+    if _inventory_snapshot is None:
+        _inventory_snapshot = InventorySnapshot()
+    return _inventory_snapshot
+def get_on_hand(product_ids, outlet_id: str) -> pd.Series:
+    """
+    On-hand levels for `product_ids` at `outlet_id` from the local inventory snapshot.
+    """
+    return get_inventory_snapshot().get_on_hand(product_ids, outlet_id)
+def find_well_stocked(combined_df: pd.DataFrame, outlet_id: str, level: int = None) -> pd.DataFrame:
+    """
+    Order lines (with an 'id' column) whose product already has at least
+    `level` units on hand at the outlet. Adds an 'on_hand' column.
+    """
+    level = WELL_STOCKED_LEVEL if level is None else level
+    if combined_df.empty or 'id' not in combined_df.columns:
+        return combined_df.iloc[0:0]
+    on_hand = get_on_hand(combined_df['id'].dropna(), outlet_id)
+    flagged = combined_df.assign(on_hand=combined_df['id'].astype("string").map(on_hand))
+    return flagged[flagged['on_hand'].fillna(0) >= level]
 def save_all_products_CSV(product_list, filename):
     import pandas as pd
+    if not isinstance(product_list, pd.DataFrame):
+        product_list = [p.as_dict() if isinstance(p, CompactRecord) else p for p in product_list]
     products_df = pd.DataFrame(product_list)
     products_df.to_csv(filename)
 def get_all_inventory():
-    url = f"{BASE_URL}/inventory"
     inventory = []
-    headers = {
-        "Authorization": f"Bearer {API_KEY}",
-        "Accept": "application/json"
-    }
-
-    while True:
-        response = requests.get(url, headers=headers)
-        if response.status_code != 200:
-            print(f"Error {response.status_code}: {response.text}")
-            break
-
-        r = response.json()
-        batch = r.get('data', [])
-        if not batch:
-            break
-
+    for batch, _ in get_client().paginate("inventory"):
         inventory.extend(batch)
-
-        # Use version-based pagination
-        version = r.get("version", {}).get("max")
-        if version:
-            url = f"{BASE_URL}/inventory?after={version}"
-        else:
-            break  # No next page available
-
     return inventory
 def save_inventory_CSV(inventory_list, filename):
     import pandas as pd
     inventory_df = pd.DataFrame(inventory_list)
     inventory_df.to_csv(filename)
-def read_faire_order(file_path: str) -> pd.DataFrame:
-    import pandas as pd
+# Faire order columns the pipeline uses, with compact dtypes
+FAIRE_ORDER_DTYPES = {
+    'Order Number': 'string',
+    'SKU': 'string',
+    'Brand Name': 'category',
+    'Product Name': 'string',
+    'Quantity': 'string',
+    'Wholesale Price': 'string',
+    'Retail Price': 'string',
+}
+FAIRE_ORDER_COLUMNS = list(FAIRE_ORDER_DTYPES)
+def _numeric_column(series: pd.Series) -> pd.Series:
+    """
+    Parses a whole column of currency/number strings ('$1,014.70', NBSPs) at once.
+    Values that can't be parsed become NaN.
+    """
+    if pd.api.types.is_numeric_dtype(series):
+        return series.astype("float64")
+    cleaned = (
+        series.astype("string")
+        .str.replace(r"[$,\s\xa0]", "", regex=True)
+    )
+    return pd.to_numeric(cleaned, errors="coerce")
+def _compact_faire_order(df: pd.DataFrame) -> pd.DataFrame:
+    for col in ['Wholesale Price', 'Retail Price']:
+        if col in df.columns:
+            df[col] = _numeric_column(df[col])
+    if 'Quantity' in df.columns:
+        # Left as float: normalize_faire_order() rejects fractional quantities before casting
+        df['Quantity'] = _numeric_column(df['Quantity'])
+    return df
+def read_faire_order(file_path: str, usecols: list = FAIRE_ORDER_COLUMNS, compact: bool = True) -> pd.DataFrame:
     """
     Reads a Faire order CSV file and returns a DataFrame.
+
+    Only `usecols` are loaded, with compact dtypes: category for the brand
+    and, unless compact=False, numbers for prices and quantities (otherwise
+    left as strings for normalize_faire_order()).
     
     Parameters:
         file_path (str): Path to the Faire order CSV file.
+        usecols (list): Columns to load (None loads every column).
+        compact (bool): Parse prices and quantities into numbers right away.
         
     Returns:
         pd.DataFrame: The loaded order data.
     """
+    wanted = set(usecols) if usecols is not None else None
     try:
-        df = pd.read_csv(file_path)
+        df = pd.read_csv(file_path, usecols=(lambda col: col in wanted) if wanted is not None else None,
+                         dtype={col: dtype for col, dtype in FAIRE_ORDER_DTYPES.items() if dtype != 'category'})
+        if compact:
+            df = _compact_faire_order(df)
+        if 'Brand Name' in df.columns:
+            df['Brand Name'] = df['Brand Name'].astype('category')
         # print(f"Successfully loaded {len(df)} rows from '{file_path}'.")
         return df
     except FileNotFoundError:
@@ -105,80 +1054,314 @@ def read_faire_order(file_path: str) -> pd.DataFrame:
         print("Error: Could not parse the file.")
     return pd.DataFrame()  # Return empty DataFrame on error
 
-def read_products_csv(csv_filepath):
-    import pandas as pd
-    import ast
-
+def read_faire_order_lines(file_path: str, usecols: list = FAIRE_ORDER_COLUMNS, sum_columns: list = None,
+                           chunksize: int = None) -> tuple:
     """
-    Reads a Lightspeed products CSV file and returns a DataFrame,
-    filtering out rows with missing supplier_code. Also extracts
-    brand names from the 'brand' column into a new 'brand_name' column.
+    Reads, cleans and folds a Faire order CSV `chunksize` rows at a time
+    (default FAIRE_READ_CHUNKSIZE). Each chunk is parsed with compact dtypes,
+    run through normalize_faire_order() and its repeated products folded by
+    aggregate_order_lines() before the next one is read, so peak memory
+    follows the number of distinct order lines, not the size of the export.
+    The folded chunks are then folded once more across chunk boundaries.
 
     Parameters:
-        csv_filepath (str): Path to the products CSV file.
+        file_path (str): Path to the Faire order CSV file.
+        usecols (list): Columns to load.
+        sum_columns (list): Extra numeric columns (e.g. outlet split columns)
+            summed with the quantities; those missing from the file are skipped.
+        chunksize (int): Rows parsed at a time.
 
     Returns:
-        pd.DataFrame: The loaded product data with valid supplier codes.
+        tuple: (order DataFrame, report DataFrame with 'row', 'SKU', 'problem'
+                and 'action' as from normalize_faire_order(); 'row' is the
+                row's position in the file)
     """
+    report_columns = ['row', 'SKU', 'problem', 'action']
+    sum_columns = list(sum_columns or [])
+    wanted = set(usecols) | set(sum_columns)
+    lines, reports, prices = [], [], []
     try:
-        df = pd.read_csv(csv_filepath)
-        df = df[df['supplier_code'].notna()]
-
-        if 'brand' in df.columns:
-            def extract_brand_name(brand_str):
-                try:
-                    brand_info = ast.literal_eval(brand_str)
-                    return brand_info.get('name')
-                except (ValueError, SyntaxError, TypeError):
-                    return None
-
-            df['brand_name'] = df['brand'].apply(extract_brand_name)
-
-        return df
-
+        with pd.read_csv(file_path, usecols=lambda col: col in wanted, chunksize=chunksize or FAIRE_READ_CHUNKSIZE,
+                         dtype={col: dtype for col, dtype in FAIRE_ORDER_DTYPES.items() if dtype != 'category'}
+                         ) as reader:
+            for chunk in reader:
+                present = [col for col in sum_columns if col in chunk.columns]
+                chunk = _compact_faire_order(chunk).assign(
+                    _rows=1, **{col: _numeric_column(chunk[col]).fillna(0) for col in present})
+                chunk, report = normalize_faire_order(chunk)
+                reports.append(report)
+                if {'SKU', 'Brand Name', 'Wholesale Price'} <= set(chunk.columns):
+                    # Each distinct price of a product, to report conflicts across chunks
+                    keys = pd.DataFrame(product_keys(chunk['SKU'], chunk['Brand Name']),
+                                        columns=['code_key', 'brand_key'], index=chunk.index)
+                    prices.append(keys.assign(row=chunk.index, SKU=chunk['SKU'], price=chunk['Wholesale Price'])
+                                  .drop_duplicates(['code_key', 'brand_key', 'price']))
+                lines.append(aggregate_order_lines(chunk, sum_columns=present, row_counts='_rows')[0])
     except FileNotFoundError:
-        print(f"Error: File '{csv_filepath}' not found.")
+        print(f"Error: File '{file_path}' not found.")
     except pd.errors.EmptyDataError:
         print("Error: The file is empty.")
     except pd.errors.ParserError:
         print("Error: Could not parse the file.")
-    except KeyError:
-        print("Error: The 'supplier_code' column is missing.")
-    
-    return pd.DataFrame()  # Return empty DataFrame on error
-def get_all_brands():
+        lines = []  # Don't process half an order
+    if not lines:
+        return pd.DataFrame(), pd.DataFrame(columns=report_columns)
+
+    order_df = lines[0] if len(lines) == 1 else pd.concat(lines)
+    if 'Brand Name' in order_df.columns:
+        order_df['Brand Name'] = order_df['Brand Name'].astype("string").astype("category")
+    present = [col for col in sum_columns if col in order_df.columns]
+    order_df, duplicates = aggregate_order_lines(order_df, sum_columns=present, row_counts='_rows')
+    reports.append(duplicates[duplicates['action'] == _REPEATED_ROWS_ACTION])
+    if prices:
+        prices = pd.concat(prices).drop_duplicates(['code_key', 'brand_key', 'price'])
+        grouped = prices.groupby(['code_key', 'brand_key'], sort=False, dropna=False)
+        conflict = prices[~prices.duplicated(['code_key', 'brand_key']) & (grouped['price'].transform('nunique') > 1)]
+        listed = grouped['price'].transform(lambda p: ", ".join(f"{v:.2f}" for v in p.dropna().unique()))
+        reports.append(pd.DataFrame({
+            'row': conflict['row'],
+            'SKU': conflict['SKU'],
+            'problem': [f"rows disagree on Wholesale Price ({listed_prices})" for listed_prices in listed[conflict.index]],
+            'action': "first row's price kept",
+        }))
+    reports = [r for r in reports if not r.empty]
+    report = pd.concat(reports, ignore_index=True) if reports else pd.DataFrame(columns=report_columns)
+    return order_df.drop(columns='_rows'), report.sort_values('row', kind='stable', ignore_index=True)
+def normalize_faire_order(faire_df: pd.DataFrame) -> tuple:
     """
-    Retrieves all brands from Lightspeed X-Series using paginated API calls.
+    Cleans a Faire order in one column-wise pass, right after read_faire_order():
+    trims SKUs, brand and product names, and parses prices ('$1,014.70',
+    NBSPs) and quantities into numbers.
+
+    Rows without a SKU or brand, or without a positive whole quantity, are
+    dropped. Prices that can't be parsed are set to 0.0 and kept.
+
+    Returns:
+        tuple: (normalized DataFrame, report DataFrame with one row per problem:
+                'row' (original index), 'SKU', 'problem', 'action')
     """
-    url = f"{BASE_URL}/brands"
-    brands = []
+    report_columns = ['row', 'SKU', 'problem', 'action']
+    if faire_df.empty:
+        return faire_df, pd.DataFrame(columns=report_columns)
+
+    df = faire_df.copy()
+    for col in ['SKU', 'Product Name']:
+        if col in df.columns:
+            df[col] = df[col].astype("string").str.strip().replace("", pd.NA)
+    if 'Brand Name' in df.columns:
+        df['Brand Name'] = df['Brand Name'].astype("string").str.strip().replace("", pd.NA).astype("category")
+
+    problems = []
+
+    def flag(mask, problem, action):
+        if mask.any():
+            problems.append(pd.DataFrame({
+                'row': df.index[mask],
+                'SKU': df.loc[mask, 'SKU'] if 'SKU' in df.columns else pd.NA,
+                'problem': problem,
+                'action': action,
+            }))
+
+    for col in ['Wholesale Price', 'Retail Price']:
+        if col in df.columns:
+            parsed = _numeric_column(df[col])
+            flag(parsed.isna() | (parsed < 0), f"invalid {col}", "price set to 0.0")
+            df[col] = parsed.where(parsed >= 0, 0.0).fillna(0.0)
+
+    drop = pd.Series(False, index=df.index)
+    if 'SKU' in df.columns:
+        flag(df['SKU'].isna(), "missing SKU", "row dropped")
+        drop |= df['SKU'].isna()
+    if 'Brand Name' in df.columns:
+        flag(df['Brand Name'].isna() & ~drop, "missing Brand Name", "row dropped")
+        drop |= df['Brand Name'].isna()
+    if 'Quantity' in df.columns:
+        quantity = _numeric_column(df['Quantity'])
+        bad_quantity = quantity.isna() | (quantity <= 0) | (quantity % 1 != 0)
+        flag(bad_quantity & ~drop, "invalid Quantity", "row dropped")
+        drop |= bad_quantity
+        df['Quantity'] = quantity.where(~bad_quantity).astype("Int32")
+
+    report = pd.concat(problems, ignore_index=True) if problems else pd.DataFrame(columns=report_columns)
+    return df[~drop], report
+_REPEATED_ROWS_ACTION = "quantities summed into one line"
+def aggregate_order_lines(faire_df: pd.DataFrame, sum_columns: list = None, row_counts: str = None) -> tuple:
+    """
+    Folds repeated (SKU, Brand Name) rows of an order into one line, so each
+    product is created and posted once. SKUs and brands are compared by
+    product_key(), so case and whitespace variants are folded too. Quantities (and any `sum_columns`,
+    e.g. outlet split columns) are summed; the first row's prices and names
+    are kept. Rows from different order files (the 'order_file' column, if
+    present) are never combined.
 
-    while url:
-        response = requests.get(url, headers=HEADERS)
-        if response.status_code != 200:
-            print(f"Error {response.status_code}: {response.text}")
-            break
+    `row_counts` names a column holding how many source rows each row
+    already stands for (when folding lines that were folded before, as
+    read_faire_order_lines() does); it is summed and drives the report.
 
-        data = response.json()
-        brands.extend(data.get('data', []))
+    Returns:
+        tuple: (aggregated DataFrame keeping the first row's index, report
+                DataFrame with 'row', 'SKU', 'problem', 'action' like
+                normalize_faire_order())
+    """
+    report_columns = ['row', 'SKU', 'problem', 'action']
+    if faire_df.empty:
+        return faire_df, pd.DataFrame(columns=report_columns)
+    # Rows are the same product when their product_key() is, as in the catalog match
+    key_df = faire_df[[col for col in ('order_file',) if col in faire_df.columns]].astype(str)
+    if 'SKU' in faire_df.columns and 'Brand Name' in faire_df.columns:
+        key_df = key_df.assign(**dict(zip(['code_key', 'brand_key'], zip(*product_keys(faire_df['SKU'],
+                                                                                        faire_df['Brand Name'])))))
+    first = ~key_df.duplicated(keep='first')
+    counted = row_counts is not None and row_counts in faire_df.columns
+    if key_df.columns.empty or (first.all() and not counted):
+        return faire_df, pd.DataFrame(columns=report_columns)
+
+    grouped = faire_df.groupby([key_df[col] for col in key_df.columns], sort=False, dropna=False)
+    rows = grouped[row_counts].transform('sum') if counted else grouped[faire_df.columns[0]].transform('size')
+    aggregated = faire_df[first].copy()
+    if counted:
+        aggregated[row_counts] = rows[first]
+    if 'Quantity' in faire_df.columns:
+        aggregated['Quantity'] = grouped['Quantity'].transform('sum')[first].astype(faire_df['Quantity'].dtype)
+    for col in sum_columns or []:
+        aggregated[col] = grouped[col].transform('sum')[first]
+
+    repeated = first & (rows > 1)
+    problems = [pd.DataFrame({
+        'row': faire_df.index[repeated],
+        'SKU': faire_df.loc[repeated, 'SKU'],
+        'problem': [f"SKU appears on {n} rows" for n in rows[repeated]],
+        'action': _REPEATED_ROWS_ACTION,
+    })]
+    if 'Wholesale Price' in faire_df.columns:
+        prices = grouped['Wholesale Price'].transform('nunique')
+        conflict = repeated & (prices > 1)
+        if conflict.any():
+            listed = grouped['Wholesale Price'].transform(lambda p: ", ".join(f"{v:.2f}" for v in p.dropna().unique()))
+            problems.append(pd.DataFrame({
+                'row': faire_df.index[conflict],
+                'SKU': faire_df.loc[conflict, 'SKU'],
+                'problem': [f"rows disagree on Wholesale Price ({listed_prices})" for listed_prices in listed[conflict]],
+                'action': "first row's price kept",
+            }))
+    return aggregated, pd.concat(problems, ignore_index=True)
+def normalize_code(code) -> str:
+    """
+    Normalizes a supplier code / SKU for matching: Unicode compatibility
+    forms, case and runs of whitespace are ignored. Punctuation is kept,
+    since 'AB-1' and 'AB1' can be different products.
+    """
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", str(code))).strip().casefold()
+@lru_cache(maxsize=4096)
+def _brand_key(name: str) -> str:
+    return normalize_name(name)
+def product_key(supplier_code, brand_name) -> tuple:
+    """
+    The key products and order lines are matched on: (normalize_code(),
+    normalize_name()) of the supplier code / SKU and the brand name. Parts
+    that are missing are None.
+    """
+    code = normalize_code(supplier_code) if supplier_code is not None and not pd.isna(supplier_code) else None
+    brand = _brand_key(str(brand_name)) if brand_name is not None and not pd.isna(brand_name) else None
+    return code or None, brand or None
+def product_keys(codes: pd.Series, brands: pd.Series) -> list:
+    """
+    product_key() for whole columns: the codes are normalized with vectorized
+    string operations and each distinct brand name only once.
+    """
+    codes = pd.Series(codes).astype("string")
+    code_keys = (codes.str.normalize("NFKC").str.replace(r"\s+", " ", regex=True).str.strip().str.casefold()
+                 .replace("", pd.NA))
+    brands = pd.Series(brands).astype("string")
+    brand_keys = brands.map({name: _brand_key(name) or None for name in brands.dropna().unique()})
+    return list(zip(code_keys.astype(object).where(code_keys.notna(), None).tolist(),
+                    brand_keys.astype(object).where(brand_keys.notna(), None).tolist()))
+def _index_products(keyed_rows) -> tuple:
+    """
+    Builds {key: product} from (key, (id, supplier_code, brand_name, name))
+    pairs, keeping the first product of every key and reporting the others.
+    """
+    index = {}
+    clashes = defaultdict(list)
+    for key, (pid, supplier_code, brand_name, name) in keyed_rows:
+        if key in index:
+            clashes[key].append(pid)
+            continue
+        index[key] = {"id": pid, "supplier_code": supplier_code, "brand_name": brand_name, "name": name}
+    conflicts = pd.DataFrame(
+        [(index[key]["supplier_code"], index[key]["brand_name"], ", ".join(map(str, [index[key]["id"], *ids])),
+          index[key]["id"]) for key, ids in clashes.items()],
+        columns=['supplier_code', 'brand_name', 'ids', 'kept_id'])
+    return index, conflicts
+def build_catalog_index(products_df: pd.DataFrame) -> tuple:
+    """
+    Reduces a catalog frame to one product per product_key(), the key orders
+    are matched on. When several products share a key the first is kept and
+    the clash is reported, instead of multiplying order lines.
 
-        # Handle pagination
-        version = data.get("version", {})
-        max_version = version.get("max")
-        if max_version:
-            url = f"{BASE_URL}/brands?after={max_version}"
-        else:
-            break
+    Returns:
+        tuple: (dict {key: product dict with 'id', 'supplier_code',
+                'brand_name', 'name'}, conflicts DataFrame with
+                'supplier_code', 'brand_name', 'ids' and 'kept_id')
+    """
+    slim = products_df[['id', 'supplier_code', 'brand_name', 'name']].dropna(subset=['supplier_code', 'brand_name'])
+    keys = product_keys(slim['supplier_code'], slim['brand_name'])
+    return _index_products(zip(keys, slim.itertuples(index=False, name=None)))
+def report_catalog_conflicts(conflicts: pd.DataFrame, log=print, limit: int = 10):
+    """
+    Logs the first `limit` key clashes found by build_catalog_index() or CatalogCache.lookup_keys().
+    """
+    for conflict in conflicts.head(limit).itertuples(index=False):
+        log(f"⚠️ Catalog has several products with supplier code {conflict.supplier_code} "
+            f"({conflict.brand_name}): {conflict.ids}; using {conflict.kept_id}.")
+    if len(conflicts) > limit:
+        log(f"⚠️ ...and {len(conflicts) - limit} more duplicated supplier codes in the catalog.")
+def match_order_lines(faire_df: pd.DataFrame, index: dict) -> tuple:
+    """
+    Matches order rows against a product index (build_catalog_index() or
+    CatalogCache.lookup_keys()) with one dictionary probe per line, so the
+    cost follows the order size, not the catalog size. SKUs and brand names
+    that differ from the catalog only in case or whitespace still match.
 
-    return brands
+    Returns:
+        tuple: (existing, missing) as in match_products_and_find_missing()
+    """
+    # Catalog keys are strings; make sure numeric-looking SKUs still line up
+    faire_df = faire_df.astype({'SKU': 'string', 'Brand Name': 'string'})
+    faire_df, duplicates = aggregate_order_lines(faire_df)
+    for problem in duplicates.itertuples(index=False):
+        print(f"⚠️ SKU {problem.SKU}: {problem.problem}, {problem.action}.")
+
+    hits = [index.get(key) for key in product_keys(faire_df['SKU'], faire_df['Brand Name'])]
+    matched_df = faire_df.reset_index(drop=True).assign(**{
+        col: pd.array([hit[col] if hit else None for hit in hits], dtype="string")
+        for col in ['id', 'supplier_code', 'brand_name', 'name']
+    })
+
+    # Separate matched and unmatched
+    found = matched_df['id'].notna()
+    existing = matched_df[found].copy()
+    missing = matched_df[~found].copy()
+
+    # Ensure consistent structure
+    if existing.empty:
+        existing = pd.DataFrame(columns=matched_df.columns)
+    if missing.empty:
+        missing = pd.DataFrame(columns=matched_df.columns)
+    return existing, missing
 def match_products_and_find_missing(products_df, faire_df):
-    import pandas as pd
     """
     Matches Lightspeed products (by supplier_code and brand_name) with Faire order SKUs and Brand Name.
     Returns two DataFrames:
       - existing (matched products with Lightspeed IDs)
       - missing (products not found in Lightspeed)
     Both are guaranteed to be valid DataFrames (even if empty).
+
+    Repeated order rows are aggregated first (aggregate_order_lines()) and
+    the catalog is reduced to one product per normalized key
+    (build_catalog_index()), so every order line matches at most one product.
+    With the local catalog, match_order_lines() over
+    CatalogCache.lookup_keys() does the same without indexing every product.
     """
     if 'SKU' not in faire_df.columns or 'supplier_code' not in products_df.columns:
         raise ValueError("Faire data must contain 'SKU', and Lightspeed data must contain 'supplier_code'.")
@@ -188,31 +1371,163 @@ def match_products_and_find_missing(products_df, faire_df):
     if 'Brand Name' not in faire_df.columns:
         raise ValueError("Faire data must include 'Brand Name'.")
 
-    # Create slimmed down, temporary copies for merging without modifying originals
-    products_slim = products_df[['id', 'supplier_code', 'brand_name', 'name']].dropna(subset=['supplier_code', 'brand_name'])
-    faire_slim = faire_df[['SKU', 'Brand Name']].copy()
-
-    # Merge on both SKU + brand
-    merged_df = pd.merge(
-        faire_df,
-        products_slim,
-        how='left',
-        left_on=['SKU', 'Brand Name'],
-        right_on=['supplier_code', 'brand_name'],
-        suffixes=('', '_lightspeed')
-    )
+    # One product per key; clashes are reported rather than multiplying lines
+    index, conflicts = build_catalog_index(products_df)
+    report_catalog_conflicts(conflicts)
+    return match_order_lines(faire_df, index)
+def match_catalog_products(faire_df: pd.DataFrame, catalog: CatalogCache = None, log=print) -> tuple:
+    """
+    match_order_lines() against the local catalog's persisted key index.
 
-    # Separate matched and unmatched
-    existing = merged_df[merged_df['id'].notna()].copy()
-    missing = merged_df[merged_df['id'].isna()].copy()
+    Returns:
+        tuple: (existing, missing) as in match_products_and_find_missing()
+    """
+    if catalog is None:
+        catalog = get_catalog_cache()
+    index, conflicts = catalog.lookup_keys(product_keys(faire_df['SKU'], faire_df['Brand Name']))
+    report_catalog_conflicts(conflicts, log=log)
+    return match_order_lines(faire_df, index)
+def match_products_streaming(faire_df: pd.DataFrame, pages, index: dict = None) -> tuple:
+    """
+    Matches an order while catalog pages are still arriving.
 
-    # Ensure consistent structure
-    if existing.empty:
-        existing = pd.DataFrame(columns=merged_df.columns)
-    if missing.empty:
-        missing = pd.DataFrame(columns=merged_df.columns)
+    Keys already in `index` (e.g. from the local cache's lookup_keys()) are
+    resolved first. Each page from `pages` is then checked against the
+    normalized keys still unresolved, and pagination stops as soon as none
+    are left, so a small re-order doesn't wait for the whole catalog.
 
-    return existing, missing
+    Args:
+        faire_df (pd.DataFrame): Normalized order rows.
+        pages (iterable): (products, version max) pages, e.g. CatalogCache.iter_sync().
+        index (dict): Products already known locally, keyed by product_key().
+
+    Returns:
+        tuple: (existing, missing, stats) where existing/missing are as in
+               match_products_and_find_missing() and stats is a dict with
+               'pages', 'products_scanned', 'unresolved' and 'early_exit'.
+    """
+    index = dict(index or {})
+    remaining = {key for key in product_keys(faire_df['SKU'], faire_df['Brand Name'])
+                 if key[0] and key[1]} - set(index)
+
+    stats = {"pages": 0, "products_scanned": 0, "unresolved": len(remaining), "early_exit": not remaining}
+    if remaining:
+        for page, _ in pages:
+            stats["pages"] += 1
+            stats["products_scanned"] += len(page)
+            for product in page:
+                if product.get("deleted_at"):
+                    continue
+                row = _product_row(product)
+                key = product_key(row[2], row[4])
+                if key in remaining:
+                    # Newer page versions replace what the cache had for the same product
+                    index[key] = {"id": row[0], "supplier_code": row[2], "brand_name": row[4], "name": row[1]}
+                    remaining.discard(key)
+            if not remaining:
+                stats["early_exit"] = True
+                break
+        stats["unresolved"] = len(remaining)
+
+    existing, missing = match_order_lines(faire_df, index)
+    return existing, missing, stats
+def choose_lookup_strategy(unresolved: int, catalog_size: int, catalog_version, synced_at) -> tuple:
+    """
+    Picks how to resolve the SKUs the local catalog doesn't have.
+
+    - 'cache': everything was found locally, no network needed.
+    - 'targeted': one search request per SKU; used for small orders when
+      the catalog was never downloaded, or when the last sync is old and
+      the searches cost fewer requests than the pages a delta over a
+      catalog of `catalog_size` products can take.
+    - 'full' / 'incremental': stream the whole catalog or the changes
+      since the last sync, stopping early once every SKU is found.
+
+    Returns:
+        tuple: (strategy, reason)
+    """
+    if unresolved == 0:
+        return "cache", "all SKUs found in the local catalog"
+    if catalog_version is None or catalog_size == 0:
+        if unresolved <= TARGETED_MAX_SKUS:
+            return "targeted", f"catalog not downloaded yet and only {unresolved} SKUs to look up"
+        return "full", f"catalog not downloaded yet and {unresolved} SKUs to look up"
+    age = time.time() - synced_at if synced_at else None
+    # A stale delta can be as long as the catalog; searching only pays off when it is many pages
+    pages = -(-catalog_size // CATALOG_PAGE_SIZE)
+    if unresolved <= TARGETED_MAX_SKUS and unresolved < pages and (age is None or age > INCREMENTAL_MAX_AGE):
+        age_text = f"is {age / 3600:.1f}h old" if age is not None else "never completed"
+        return "targeted", (f"{unresolved} SKUs to look up against a catalog of up to {pages} pages "
+                            f"and the last full sync {age_text}")
+    return "incremental", f"{unresolved} SKUs to look up in the changes since the last sync"
+def _timed_pages(pages, seconds: list):
+    """
+    Passes pages through, adding the time spent waiting for each one to seconds[0].
+    """
+    iterator = iter(pages)
+    while True:
+        started = time.perf_counter()
+        try:
+            page = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            seconds[0] += time.perf_counter() - started
+        yield page
+def resolve_order_products(faire_df: pd.DataFrame, catalog: CatalogCache = None, log=print) -> tuple:
+    """
+    Matches order rows against Lightspeed, choosing the cheapest way to
+    resolve SKUs that aren't in the local catalog (see choose_lookup_strategy()).
+    The strategy, its reason and its cost are logged.
+
+    Returns:
+        tuple: (existing, missing, info) where info has 'strategy', 'reason',
+               'requests' and 'seconds'.
+    """
+    if catalog is None:
+        catalog = get_catalog_cache()
+    client = get_client()
+    metrics = get_run_metrics()
+    # The run's own counter stays accurate when several runs share the client
+    count_requests = (lambda: metrics.total_requests) if metrics else (lambda: client.request_count)
+    started = time.perf_counter()
+    requests_before = count_requests()
+
+    # Only the order's own keys are probed in the persisted index
+    order_keys = dict(zip(product_keys(faire_df['SKU'], faire_df['Brand Name']), faire_df['SKU'].astype(str)))
+    index, conflicts = catalog.lookup_keys(order_keys)
+    report_catalog_conflicts(conflicts, log=log)
+    unresolved = {key: sku for key, sku in order_keys.items() if key[0] and key[1] and key not in index}
+    strategy, reason = choose_lookup_strategy(len(unresolved), len(catalog), catalog.version, catalog.synced_at)
+
+    fetch_seconds = [0.0]
+    if strategy == "targeted":
+        fetch_started = time.perf_counter()
+        found = lookup_products_targeted(unresolved.values())
+        fetch_seconds[0] += time.perf_counter() - fetch_started
+        # Keep them for later runs without moving the sync cursor
+        catalog.upsert_products(found)
+        existing, missing, _ = match_products_streaming(faire_df, [(found, None)], index)
+    elif strategy in ("full", "incremental"):
+        pages = _timed_pages(catalog.iter_sync(), fetch_seconds)
+        existing, missing, stats = match_products_streaming(faire_df, pages, index)
+        reason += (f"; scanned {stats['products_scanned']} products in {stats['pages']} pages"
+                   f"{' (stopped early)' if stats['pages'] and stats['early_exit'] else ''}")
+    else:
+        existing, missing = match_order_lines(faire_df, index)
+
+    info = {
+        "strategy": strategy,
+        "reason": reason,
+        "requests": count_requests() - requests_before,
+        "seconds": time.perf_counter() - started,
+    }
+    if metrics:
+        metrics.add_time("catalog_fetch", fetch_seconds[0])
+        metrics.add_time("match", info["seconds"] - fetch_seconds[0])
+        metrics.info["catalog_lookup"] = info
+    log(f"Catalog lookup: {strategy} ({reason}); {info['requests']} requests, {info['seconds']:.1f}s.")
+    return existing, missing, info
 def get_first_brand_name(faire_df):
     """
     Returns the brand name from the first row of the Faire order.
@@ -220,199 +1535,430 @@ def get_first_brand_name(faire_df):
     if 'Brand Name' in faire_df.columns and not faire_df.empty:
         return str(faire_df.iloc[0]['Brand Name']).strip()
     return "Unknown Supplier"
-def ensure_supplier_and_brand(brand_name: str, dry_run: bool = False) -> dict:
+def _created_id(data):
+    """
+    Pulls the new record id out of a create response's 'data' (an id, a list
+    of ids as create_product() returns, or a record).
+    """
+    if isinstance(data, dict):
+        return data.get("id")
+    if isinstance(data, list):
+        return data[0] if data else None
+    return data
+# Trailing words ignored when comparing supplier/brand names
+_NAME_SUFFIXES = {"inc", "incorporated", "llc", "ltd", "limited", "co", "corp", "corporation", "company", "gmbh"}
+def normalize_name(name) -> str:
+    """
+    Normalizes a supplier/brand name for comparison: case, accents,
+    '&' vs 'and', punctuation, extra whitespace and trailing company
+    suffixes such as 'Inc.' or 'LLC' are ignored.
+    """
+    text = unicodedata.normalize("NFKD", str(name or "")).casefold()
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = text.replace("&", " and ")
+    words = re.sub(r"[^\w\s]", " ", text).split()
+    while len(words) > 1 and words[-1] in _NAME_SUFFIXES:
+        words.pop()
+    return " ".join(words)
+def _trigrams(normalized: str) -> set:
+    padded = f"  {normalized} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+class NameIndex:
+    """
+    Lookup of supplier/brand records by normalized name.
+
+    Exact lookups are a single dict hit. near_matches() finds similarly
+    spelled names through a trigram index, so only names sharing at least
+    one trigram are ever scored, and confirms each candidate with an edit
+    similarity check.
+    """
+    def __init__(self, records: list = ()):
+        self.by_name = {}
+        self.grams = {}
+        self.postings = defaultdict(set)
+        for record in records:
+            self.add(record)
+
+    def __len__(self):
+        return len(self.by_name)
+
+    def add(self, record: dict):
+        key = normalize_name(record.get("name"))
+        if not key or key in self.by_name:
+            return
+        self.by_name[key] = record
+        grams = _trigrams(key)
+        self.grams[key] = grams
+        for gram in grams:
+            self.postings[gram].add(key)
+
+    def get(self, name: str) -> dict:
+        return self.by_name.get(normalize_name(name))
+
+    def near_matches(self, name: str, threshold: float = None, limit: int = 3, edit_ratio: float = None) -> list:
+        """
+        Returns up to `limit` (similarity, record) pairs whose trigram
+        similarity to `name` is at least `threshold` and whose edit
+        similarity is at least `edit_ratio` (NEAR_MATCH_EDIT_RATIO), best first.
+        """
+        threshold = NEAR_MATCH_THRESHOLD if threshold is None else threshold
+        edit_ratio = NEAR_MATCH_EDIT_RATIO if edit_ratio is None else edit_ratio
+        key = normalize_name(name)
+        grams = _trigrams(key)
+        shared = defaultdict(int)
+        for gram in grams:
+            for candidate in self.postings.get(gram, ()):
+                shared[candidate] += 1
+
+        scored = []
+        for candidate, count in shared.items():
+            if candidate == key:
+                continue
+            score = count / (len(grams) + len(self.grams[candidate]) - count)
+            if score >= threshold and difflib.SequenceMatcher(None, key, candidate).ratio() >= edit_ratio:
+                scored.append((score, self.by_name[candidate]))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored[:limit]
+class SupplierBrandRegistry:
+    """
+    Suppliers and brands for one run, downloaded once and shared by every
+    ensure_supplier_and_brand() call. Suppliers and brands created during the
+    run are added to it, so later lookups need no network calls.
+
+    The lists are also saved under CACHE_DIR. With a ttl (seconds) later
+    runs reuse the saved copy until it is older than the ttl; offline loads
+    (dry runs, planning) always use it, whatever its age.
+    """
+    def __init__(self, ttl: int = None, path: str = None):
+        self.ttl = REGISTRY_TTL if ttl is None else ttl
+        self.path = path or os.path.join(CACHE_DIR, f"registry_{DOMAIN_PREFIX}.json")
+        self.lock = threading.RLock()
+        self.suppliers = None
+        self.brands = None
+        self.supplier_index = NameIndex()
+        self.brand_index = NameIndex()
+        self.loaded_at = None
+        self.offline = False
+
+    def load(self, force: bool = False, offline: bool = False):
+        """
+        Loads suppliers and brands from the saved copy if it is fresh, otherwise from the API.
+        With offline=True only the saved copy is used (empty lists if there is none).
+        """
+        with self.lock:
+            if self.suppliers is not None and not force:
+                return
+            if offline:
+                self.offline = True
+                if not self._load_saved():
+                    self.suppliers, self.brands, self.loaded_at = [], [], None
+            elif force or not self.ttl or not self._load_saved(self.ttl):
+                self.suppliers = [_name_record(s) for s in get_all_suppliers()]
+                self.brands = [_name_record(b) for b in get_all_brands()]
+                self.loaded_at = time.time()
+                self.save()
+            self.supplier_index = NameIndex(self.suppliers)
+            self.brand_index = NameIndex(self.brands)
+
+    def _load_saved(self, max_age: int = None) -> bool:
+        """
+        Loads the saved copy unless it is older than max_age seconds (None: any age).
+        """
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+        except (OSError, ValueError):
+            return False
+        if max_age is not None and time.time() - saved.get("loaded_at", 0) > max_age:
+            return False
+        self.suppliers = saved.get("suppliers", [])
+        self.brands = saved.get("brands", [])
+        self.loaded_at = saved["loaded_at"]
+        return True
+
+    def save(self):
+        if self.offline or self.suppliers is None:
+            return
+        with self.lock:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            _write_json_atomic(self.path, {"loaded_at": self.loaded_at, "suppliers": self.suppliers,
+                                           "brands": self.brands})
+
+    def find_supplier(self, name: str) -> dict:
+        self.load()
+        return self.supplier_index.get(name)
+
+    def find_brand(self, name: str) -> dict:
+        self.load()
+        return self.brand_index.get(name)
+
+    def near_suppliers(self, name: str) -> list:
+        self.load()
+        return self.supplier_index.near_matches(name)
+
+    def near_brands(self, name: str) -> list:
+        self.load()
+        return self.brand_index.near_matches(name)
+
+    def add_supplier(self, supplier_id: str, name: str):
+        with self.lock:
+            self.load()
+            record = {"id": supplier_id, "name": name}
+            self.suppliers.append(record)
+            self.supplier_index.add(record)
+            self.save()
+
+    def add_brand(self, brand_id: str, name: str):
+        with self.lock:
+            self.load()
+            record = {"id": brand_id, "name": name}
+            self.brands.append(record)
+            self.brand_index.add(record)
+            self.save()
+def _name_record(record: dict) -> dict:
+    return {"id": record.get("id"), "name": record.get("name") or ""}
+_registry = None
+def get_supplier_brand_registry() -> SupplierBrandRegistry:
+    """
+    Returns the shared supplier/brand registry, creating it on first use.
+    """
+    global _registry
+    if _registry is None:
+        _registry = SupplierBrandRegistry()
+    return _registry
+def new_supplier_brand_registry(ttl: int = None) -> SupplierBrandRegistry:
+    """
+    Starts a fresh shared registry, e.g. at the beginning of a run.
+    """
+    global _registry
+    _registry = SupplierBrandRegistry(ttl=ttl)
+    return _registry
+def near_match_settings() -> dict:
+    """
+    The near-match policy and threshold in effect, for run reports.
+    """
+    return {"policy": NEAR_MATCH_POLICY, "threshold": NEAR_MATCH_THRESHOLD, "edit_ratio": NEAR_MATCH_EDIT_RATIO}
+def _resolve_near_match(kind: str, name: str, near: list) -> dict:
+    """
+    Applies NEAR_MATCH_POLICY when `name` has no exact match but similar names exist.
+    Returns the record to reuse, or None to create a new one.
+    """
+    if not near:
+        return None
+    options = ", ".join(f"'{record['name']}' ({score:.0%})" for score, record in near)
+    if NEAR_MATCH_POLICY == "use":
+        print(f"No exact {kind} named '{name}'; using near match '{near[0][1]['name']}'.")
+        return near[0][1]
+    if NEAR_MATCH_POLICY == "create":
+        print(f"No exact {kind} named '{name}' (similar: {options}); creating a new one.")
+        return None
+    raise ValueError(
+        f"No exact {kind} named '{name}', but similar ones exist: {options}. "
+        f"Fix the name in the order or set FAIRE_NEAR_MATCH to 'use' or 'create'."
+    )
+def ensure_supplier_and_brand(brand_name: str, dry_run: bool = None, registry: SupplierBrandRegistry = None) -> dict:
     """
     Ensures a supplier and brand with the given name exist in Lightspeed X-Series.
     Creates them if they do not exist.
 
     Args:
         brand_name (str): The name to use for both supplier and brand.
-        dry_run (bool): Simulate the process without real API calls.
+        dry_run (bool): Simulate the process without any API calls; names are
+            looked up in the saved registry only (None uses DRY_RUN).
+        registry (SupplierBrandRegistry): Where to look names up
+            (defaults to the shared registry).
 
     Returns:
         dict: {'supplier_id': str, 'brand_id': str}
     """
+    dry_run = is_dry_run(dry_run)
+    registry = registry or get_supplier_brand_registry()
     supplier_id = None
     brand_id = None
 
-    # Load current data
-    suppliers = get_all_suppliers()
-    brands = get_all_brands()
-
-    # Check for existing supplier
-    supplier = find_supplier_by_name(suppliers, brand_name)
-    if supplier:
-        supplier_id = supplier['id']
-    else:
-        result = create_supplier(name=brand_name, dry_run=dry_run)
-        if result and 'data' in result:
-            supplier_id = result['data']
-
-    # Check for existing brand
-    brand = find_supplier_by_name(brands, brand_name)  # same match logic
-    if brand:
-        brand_id = brand['id']
-    else:
-        result = create_brand(name=brand_name, dry_run=dry_run)
-        if result and 'data' in result:
-            brand_id = result['data']
+    # Hold the lock so two threads can't both create the same name
+    with registry.lock:
+        if dry_run:
+            registry.load(offline=True)
+        supplier = registry.find_supplier(brand_name)
+        brand = registry.find_brand(brand_name)
+
+        # Report near matches before creating anything
+        if not supplier:
+            supplier = _resolve_near_match("supplier", brand_name, registry.near_suppliers(brand_name))
+        if not brand:
+            brand = _resolve_near_match("brand", brand_name, registry.near_brands(brand_name))
+
+        # Check for existing supplier
+        if supplier:
+            supplier_id = supplier['id']
+        else:
+            result = create_supplier(name=brand_name, dry_run=dry_run)
+            if result and 'data' in result:
+                supplier_id = _created_id(result['data'])
+                if not dry_run:
+                    registry.add_supplier(supplier_id, brand_name)
+
+        # Check for existing brand
+        if brand:
+            brand_id = brand['id']
+        else:
+            result = create_brand(name=brand_name, dry_run=dry_run)
+            if result and 'data' in result:
+                brand_id = _created_id(result['data'])
+                if not dry_run:
+                    registry.add_brand(brand_id, brand_name)
 
     return {
         "supplier_id": supplier_id,
         "brand_id": brand_id
     }
 def get_all_suppliers():
-    url = f"{BASE_URL}/suppliers"
+    """
+    Retrieves all suppliers from Lightspeed X-Series using paginated API calls.
+    """
     suppliers = []
-
-    while url:
-        response = requests.get(url, headers=HEADERS)
-        if response.status_code != 200:
-            print(f"Error {response.status_code}: {response.text}")
-            break
-
-        data = response.json()
-        suppliers.extend(data.get('data', []))
-
-        # Pagination fix: stop if version max is None
-        version = data.get("version", {})
-        max_version = version.get("max")
-        if max_version:
-            url = f"{BASE_URL}/suppliers?after={max_version}"
-        else:
-            break
-
+    for page, _ in get_client().paginate("suppliers"):
+        suppliers.extend(page)
     return suppliers
 
 def get_all_brands():
     """
     Retrieves all brands from Lightspeed X-Series using paginated API calls.
     """
-    url = f"{BASE_URL}/brands"
     brands = []
-
-    while url:
-        response = requests.get(url, headers=HEADERS)
-        if response.status_code != 200:
-            print(f"Error {response.status_code}: {response.text}")
-            break
-
-        data = response.json()
-        brands.extend(data.get('data', []))
-
-        # Handle pagination
-        version = data.get("version", {})
-        max_version = version.get("max")
-        if max_version:
-            url = f"{BASE_URL}/brands?after={max_version}"
-        else:
-            break
-
+    for page, _ in get_client().paginate("brands"):
+        brands.extend(page)
     return brands
 def find_supplier_by_name(suppliers: list, target_name: str) -> dict:
     """
-    Looks for a supplier in the list that matches the target name (case-insensitive).
+    Looks for a supplier in the list that matches the target name (see normalize_name()).
     Returns the full supplier dict if found, otherwise None.
     """
-    target = target_name.strip().lower()
+    target = normalize_name(target_name)
     for supplier in suppliers:
-        if supplier.get("name", "").strip().lower() == target:
+        if normalize_name(supplier.get("name", "")) == target:
             return supplier
     return None
-def create_product(payload: dict):
-    if DRY_RUN:
+def create_product(payload: dict, dry_run: bool = None):
+    if is_dry_run(dry_run):
         print(f"[DRY RUN] Would create product: {payload['name']} (SKU: {payload['supplier_code']})")
-        return {"id": f"dry_{payload['supplier_code']}", "name": payload["name"]}  # fake ID
+        return [f"dry_{payload['supplier_code']}"]  # fake ID, same shape as the API's 'data'
     else:
-        url = f"{BASE_URL}/products"
-        response = requests.post(url, headers=HEADERS, json=payload)
+        response = get_client().post("products", json=payload)
         # print(response.status_code)
         if response.status_code == 200 or response.status_code == 201:
             # print(response.json())
             print(f"Created Product {payload['name']}, SKU {payload['supplier_code']}")
             return response.json().get('data')
         else:
-            print(f"Failed to create product: {response.text}")
+            print(f"Failed to create product SKU {payload['supplier_code']}: {response.text}")
             return None
-def create_missing_products(missing_df, dry_run: bool = False):
+def create_missing_products(missing_df, dry_run: bool = None, max_workers: int = None,
+                            registry: SupplierBrandRegistry = None, on_created=None, outlet_id: str = None,
+                            outlet_ids: list = None):
     """
     Create new products in Lightspeed for each missing SKU.
-    Returns a list of product records with 'id', 'supplier_code', and 'name'.
+    Returns a list of product records with 'id', 'supplier_code', and 'name',
+    in the same order as missing_df. SKUs that could not be created are
+    reported and left out.
+
+    Args:
+        missing_df (pd.DataFrame): Missing rows from match_products_and_find_missing().
+        dry_run (bool): Simulate every creation without API calls (None uses DRY_RUN).
+        max_workers (int): Number of products created concurrently
+            (defaults to CREATE_WORKERS; 1 creates them one at a time).
+        registry (SupplierBrandRegistry): Supplier/brand lookup for this run.
+        on_created (callable): Called with each created record as soon as it exists.
+        outlet_id (str): Outlet the new products get an inventory entry for (defaults to OUTLET_ID).
+        outlet_ids (list): Several outlets instead, e.g. those of an outlet split.
     """
     if missing_df.empty:
         print("No missing products to create.")
         return []
 
+    dry_run = is_dry_run(dry_run)
     # Extract brand name from the first row
     brand_name = get_first_brand_name(missing_df)
 
     # Ensure supplier and brand exist
-    ids = ensure_supplier_and_brand(brand_name, dry_run=dry_run)
+    ids = ensure_supplier_and_brand(brand_name, dry_run=dry_run, registry=registry)
     supplier_id = ids.get("supplier_id")
     brand_id = ids.get("brand_id")
 
+    rows = [
+        (payload, {
+            "supplier_code": payload["supplier_code"],
+            "name": payload["name"],
+            "Quantity": f"{quantity}",
+            "Wholesale Price": payload["supply_price"],
+            "Retail Price": payload["price_excluding_tax"],
+            "Brand Name": f"{brand}"
+        })
+        for payload, quantity, brand in zip(
+            build_product_payloads(missing_df, supplier_id, brand_id, outlet_id=outlet_id, outlet_ids=outlet_ids),
+            missing_df['Quantity'],
+            missing_df['Brand Name'],
+        )
+    ]
+
+    def create_one(item):
+        payload, record = item
+        try:
+            product_id = _created_id(create_product(payload, dry_run=dry_run))
+        except Exception as e:
+            return None, f"{e.__class__.__name__}: {e}"
+        if not product_id:
+            return None, "API did not return a product id"
+        if on_created:
+            on_created({"id": product_id, **record})
+        return {"id": product_id, **record}, None
+
+    workers = max(1, min(max_workers or CREATE_WORKERS, len(rows)))
+    # Results come back in missing_df order
+    results = parallel_map(create_one, rows, workers)
+
     created = []
+    failed = []
+    for (payload, _), (record, error) in zip(rows, results):
+        if record:
+            created.append(record)
+        else:
+            failed.append(payload["supplier_code"])
+            print(f"Could not create SKU {payload['supplier_code']}: {error}")
 
-    for _, row in missing_df.iterrows():
-        sku = row['SKU']
-        name = f"{row['Product Name']}"
-        supply_price = float(str(row['Wholesale Price']).replace('$', '').strip())
-        retail_price = float(str(row['Retail Price']).replace('$', '').strip())
-        quantity = f"{row['Quantity']}"
-        brand = f"{row['Brand Name']}"
+    print(f"Created {len(created)} of {len(rows)} missing products ({workers} workers).")
+    if failed:
+        print(f"Failed SKUs: {', '.join(str(sku) for sku in failed)}")
 
-        payload = {
-            "name": name,
-            "supplier_code": sku,
-            "supply_price": supply_price,
-            "price_excluding_tax": retail_price,
-            "customSku": True,
-            "type": "standard",
-            "supplier_id": supplier_id,
-            "brand_id": brand_id,
-            "inventory": [{ "current_amount": 0,
-                           "outlet_id": OUTLET_ID
-                            }]       
-        }
-        # print(payload)
-
-        result = create_product(payload)
-        # print(result[0])
-        if result:
-            created.append({
-                "id": result[0],
-                "supplier_code": sku,
-                "name": name,
-                "Quantity": quantity,
-                "Wholesale Price": supply_price,
-                "Retail Price": retail_price,
-                "Brand Name": brand
-            })
+    if created and not dry_run:
+        get_catalog_cache().add_created_products([
+            {**c, "brand_id": brand_id, "supplier_id": supplier_id} for c in created
+        ])
 
     return created
-def create_supplier(name: str, description: str = "", dry_run: bool = False) -> dict:
+def create_supplier(name: str, description: str = "", dry_run: bool = None) -> dict:
     """
     Creates a new supplier in Lightspeed X-Series.
 
     Args:
         name (str): Supplier name.
         description (str): Optional description.
-        dry_run (bool): If True, simulate without making the API call.
+        dry_run (bool): If True, simulate without making the API call (None uses DRY_RUN).
 
     Returns:
         dict: Created supplier data or simulated response.
     """
-    if dry_run:
+    if is_dry_run(dry_run):
         print(f"[DRY RUN] Would create supplier: {name}")
-        return {"name": name, "description": description, "id": "simulated-supplier-id"}
+        return {"data": {"name": name, "description": description, "id": "simulated-supplier-id"}}
 
-    url = f"{BASE_URL}/suppliers"
     payload = {
         "name": name,
         "description": description or name
     }
 
-    response = requests.post(url, headers=HEADERS, json=payload)
+    response = get_client().post("suppliers", json=payload)
     if response.status_code == 201 or response.status_code == 200:
         # print(response)
         print(f"Supplier '{name}' created successfully.")
@@ -421,27 +1967,26 @@ def create_supplier(name: str, description: str = "", dry_run: bool = False) ->
     else:
         print(f"Error creating supplier '{name}': {response.text}")
         return None
-def create_brand(name: str, dry_run: bool = False) -> dict:
+def create_brand(name: str, dry_run: bool = None) -> dict:
     """
     Creates a new brand in Lightspeed X-Series.
 
     Args:
         name (str): Brand name.
-        dry_run (bool): If True, simulate without making the API call.
+        dry_run (bool): If True, simulate without making the API call (None uses DRY_RUN).
 
     Returns:
         dict: Created brand data or simulated response.
     """
-    if dry_run:
+    if is_dry_run(dry_run):
         print(f"[DRY RUN] Would create brand: {name}")
-        return {"name": name, "id": "simulated-brand-id"}
+        return {"data": {"name": name, "id": "simulated-brand-id"}}
 
-    url = f"{BASE_URL}/brands"
     payload = {
         "name": name
     }
 
-    response = requests.post(url, headers=HEADERS, json=payload)
+    response = get_client().post("brands", json=payload)
     if response.status_code == 201 or response.status_code == 200:
         print(f"Brand '{name}' created successfully.")
         result = response.json()
@@ -449,31 +1994,6 @@ def create_brand(name: str, dry_run: bool = False) -> dict:
     else:
         print(f"Error creating brand '{name}': {response.text}")
         return None
-def clean_price(price_val):
-    """
-    Converts a price string like '$14.70' to float 14.70.
-    Returns 0.0 if the value cannot be parsed.
-    """
-    if pd.isna(price_val):
-        return 0.0
-
-    try:
-        if isinstance(price_val, (float, int)):
-            return float(price_val)
-
-        # Clean and convert
-        cleaned = (
-            str(price_val)
-            .replace('$', '')
-            .replace(',', '')
-            .replace('\xa0', '')  # non-breaking space
-            .strip()
-        )
-        return float(cleaned)
-    except Exception as e:
-        print(f"Warning: couldn't convert '{price_val}' to float. Error: {e}")
-        return 0.0
-
 def combine_product_ids(existing_df: pd.DataFrame, created_products: list) -> pd.DataFrame:
     """
     Combines existing and newly created products into one DataFrame with quantities,
@@ -523,22 +2043,28 @@ def combine_product_ids(existing_df: pd.DataFrame, created_products: list) -> pd
 
     return combined
 
-def create_stock_order_shell(location_id: int, faire_df: pd.DataFrame, dry_run: bool = False) -> dict:
+def create_stock_order_shell(location_id: int, faire_df: pd.DataFrame, dry_run: bool = None,
+                             registry: SupplierBrandRegistry = None, reference: str = None) -> dict:
     """
     Creates a stock order (consignment) in Lightspeed X-Series using supplier from Faire order.
     """
+    dry_run = is_dry_run(dry_run)
     # Extract brand/supplier name from order
     brand_name = get_first_brand_name(faire_df)
 
     # Ensure supplier/brand exist
-    ids = ensure_supplier_and_brand(brand_name, dry_run=dry_run)
-    supplier_id = ids.get("supplier_id")
-
-    if dry_run:
+    ids = ensure_supplier_and_brand(brand_name, dry_run=dry_run, registry=registry)
+    return create_consignment(location_id, brand_name, ids.get("supplier_id"), dry_run=dry_run, reference=reference)
+def create_consignment(location_id: str, brand_name: str, supplier_id: str, dry_run: bool = None,
+                       reference: str = None) -> dict:
+    """
+    Creates an empty OPEN supplier consignment. Returns its data, or None on error.
+    `reference` (see consignment_reference()) lets a later sync find it again.
+    """
+    if is_dry_run(dry_run):
         print(f"[DRY RUN] Would create stock order for supplier: {brand_name} at location {location_id}")
         return {"id": "simulated-stock-order-id"}
 
-    url = f"{BASE_URL}/consignments"
     payload = {
         "name": f"Faire Stock Order - {brand_name}",
         "outlet_id": location_id,
@@ -546,54 +2072,1215 @@ def create_stock_order_shell(location_id: int, faire_df: pd.DataFrame, dry_run:
         "status": "OPEN",
         "supplier_id": supplier_id
     }
+    if reference:
+        payload["reference"] = reference
 
-    response = requests.post(url, headers=HEADERS, json=payload)
+    response = get_client().post("consignments", json=payload)
     # print(response.status_code)
     if response.status_code == 201:
         data = response.json().get("data", {})
         stock_order_id = data.get("id")
         print(f"Created stock order with ID: {stock_order_id}")
+        if reference and stock_order_id:
+            remember_consignment(reference, location_id, stock_order_id)
         return data
     else:
         print(f"Error creating stock order shell: {response.text}")
         return None
+def build_product_payloads(missing_df: pd.DataFrame, supplier_id: str, brand_id: str, outlet_id: str = None,
+                           outlet_ids: list = None) -> list:
+    """
+    Builds the create_product() payloads for a frame of normalized order rows, column-wise.
+
+    Each product gets a zero inventory entry for `outlet_ids` (e.g. the
+    outlets of a split), else for `outlet_id` or OUTLET_ID. Without any
+    outlet the inventory block is left out.
+    """
+    outlet_ids = [o for o in (outlet_ids or [outlet_id or OUTLET_ID]) if o]
+    names = missing_df['Product Name'].astype("string").fillna("").tolist()
+    skus = missing_df['SKU'].tolist()
+    supply_prices = _numeric_column(missing_df['Wholesale Price']).fillna(0.0).tolist()
+    retail_prices = _numeric_column(missing_df['Retail Price']).fillna(0.0).tolist()
+    return [
+        {
+            "name": name,
+            "supplier_code": sku,
+            "supply_price": supply_price,
+            "price_excluding_tax": retail_price,
+            "customSku": True,
+            "type": "standard",
+            "supplier_id": supplier_id,
+            "brand_id": brand_id,
+            **({"inventory": [{"current_amount": 0, "outlet_id": o} for o in outlet_ids]} if outlet_ids else {})
+        }
+        for name, sku, supply_price, retail_price in zip(names, skus, supply_prices, retail_prices)
+    ]
 def build_stock_order_lines(product_df: pd.DataFrame) -> list:
+    quantities = _numeric_column(product_df["Quantity"]).fillna(0).astype(int).tolist()
+    costs = _numeric_column(product_df['Wholesale Price']).fillna(0.0).tolist()
     return [
         {
-            "product_id": row["id"],
-            "quantity": int(row["Quantity"]),
-            "cost": float(clean_price(row['Wholesale Price']))
+            "product_id": product_id,
+            "quantity": quantity,
+            "cost": cost
         }
-        for _, row in product_df.iterrows()
+        for product_id, quantity, cost in zip(product_df["id"].tolist(), quantities, costs)
     ]
-def add_products_to_stock_order(stock_order_id: str, line_items: list):
+def add_products_to_stock_order(stock_order_id: str, line_items: list, max_workers: int = None,
+                                retry_rounds: int = 2, retry_delay: float = 2.0, on_added=None,
+                                dry_run: bool = None) -> dict:
     """
-    Adds products one-by-one to an existing stock order (consignment) in Lightspeed X-Series.
+    Adds products to an existing stock order (consignment) in Lightspeed X-Series,
+    several lines at a time. Lines the server certainly did not take (429/503,
+    connect timeout) are queued and retried after the first pass. After any
+    other server or connection error the line may have been added anyway, so
+    the consignment's lines are fetched first and only the missing ones are
+    posted again.
 
+    Args:
+        stock_order_id (str): Consignment id.
+        line_items (list): Lines from build_stock_order_lines().
+        max_workers (int): Concurrent line posts (defaults to LINE_WORKERS).
+        retry_rounds (int): How many times the retry queue is worked through.
+        retry_delay (float): Seconds to wait before each retry round.
+        on_added (callable): Called with each line as soon as it has been added.
+        dry_run (bool): Only print the lines (None uses DRY_RUN).
+
+    Returns:
+        dict: {
+            'stock_order_id': str,
+            'added': list of API responses,
+            'failed': list of {'line': dict, 'status': int or None, 'error': str},
+            'retried': number of retry attempts made,
+            'timings': {'first_pass': s, 'retries': s, 'total': s}
+        }
     """
+    result = {
+        "stock_order_id": stock_order_id,
+        "added": [],
+        "failed": [],
+        "retried": 0,
+        "timings": {"first_pass": 0.0, "retries": 0.0, "total": 0.0},
+    }
+
     # print(line_items)
-    if DRY_RUN:
+    if is_dry_run(dry_run):
         print(f"[DRY RUN] Would add {len(line_items)} items to stock order {stock_order_id}")
         for line in line_items:
             print(f"  - Product ID: {line['product_id']}, Quantity: {line['quantity']}")
-        return {"status": "simulated"}
+        result["status"] = "simulated"
+        return result
 
-    url_base = f"{BASE_URL}/consignments/{stock_order_id}/products"
-    results = []
-    
-    for line in line_items:
+    client = get_client()
+    url_base = f"consignments/{stock_order_id}/products"
+
+    def add_line(line):
         payload = {
             "product_id": line["product_id"],
             "count": line["quantity"],
             "cost": line["cost"]
         }
-
-        response = requests.post(url_base, headers=HEADERS, json=payload)
+        try:
+            response = client.post(url_base, json=payload)
+        except requests.ConnectTimeout as e:
+            # Never reached the server, so it is safe to post again
+            return None, {"line": line, "status": None, "error": f"{e.__class__.__name__}: {e}", "sent": False}
+        except (requests.ConnectionError, requests.Timeout) as e:
+            return None, {"line": line, "status": None, "error": f"{e.__class__.__name__}: {e}", "sent": True}
         if response.status_code == 200 or response.status_code == 201:
-            results.append(response.json())
+            if on_added:
+                on_added(line)
+            return response.json(), None
+        return None, {"line": line, "status": response.status_code, "error": response.text}
+
+    def run_pass(lines):
+        if not lines:
+            return []
+        outcomes = parallel_map(add_line, lines, max_workers or LINE_WORKERS)
+        failures = []
+        for added, failure in outcomes:
+            if failure:
+                failures.append(failure)
+            else:
+                result["added"].append(added)
+        return failures
+
+    started = time.perf_counter()
+    failures = run_pass(line_items)
+    result["timings"]["first_pass"] = time.perf_counter() - started
+
+    # Retry queue: lines that were certainly not added, plus lines whose outcome is unknown
+    for _ in range(retry_rounds):
+        retry_queue, uncertain, final = [], [], []
+        for failure in failures:
+            status = failure["status"]
+            if status in LightspeedClient.POST_RETRY_STATUSES or (status is None and not failure.get("sent")):
+                retry_queue.append(failure)
+            elif status is None or status >= 500:
+                uncertain.append(failure)
+            else:
+                final.append(failure)
+        if not retry_queue and not uncertain:
+            break
+        time.sleep(retry_delay)
+        if uncertain:
+            # A timed-out or 5xx POST may still have added the line: check before posting it again
+            try:
+                current = get_consignment_lines(stock_order_id)
+            except (LightspeedAPIError, requests.RequestException) as e:
+                print(f"Could not check stock order {stock_order_id} for lines already added: {e}")
+                final.extend(uncertain)
+                uncertain = []
+            else:
+                present = dict(zip(current['product_id'].tolist(), current.to_dict("records")))
+                for failure in uncertain:
+                    product_id = str(failure["line"]["product_id"])
+                    if product_id in present:
+                        result["added"].append({"data": present[product_id]})
+                        if on_added:
+                            on_added(failure["line"])
+                    else:
+                        retry_queue.append(failure)
+        if not retry_queue:
+            failures = final
+            break
+        print(f"Retrying {len(retry_queue)} failed lines on stock order {stock_order_id}...")
+        result["retried"] += len(retry_queue)
+        failures = final + run_pass([f["line"] for f in retry_queue])
+
+    result["failed"] = failures
+    result["timings"]["total"] = time.perf_counter() - started
+    result["timings"]["retries"] = result["timings"]["total"] - result["timings"]["first_pass"]
+
+    for failure in failures:
+        print(f"Error adding product {failure['line']['product_id']} to stock order: {failure['error']}")
+    print(f"Added {len(result['added'])} products to stock order {stock_order_id} "
+          f"({len(failures)} failed, {result['timings']['total']:.1f}s)")
+    return result
+def consignment_reference(order_df: pd.DataFrame, file_path: str = None) -> str:
+    """
+    Stable reference for a Faire order: its 'Order Number', or the file name
+    when the export has none. A revised export of the same order maps to the
+    same consignment.
+    """
+    if 'Order Number' in order_df.columns:
+        numbers = order_df['Order Number'].dropna().astype(str).str.strip()
+        numbers = numbers[numbers != ""]
+        if not numbers.empty:
+            return f"Faire {numbers.iloc[0]}"
+    return f"Faire {os.path.splitext(os.path.basename(file_path or ''))[0]}"
+def _consignment_index_path() -> str:
+    return os.path.join(CACHE_DIR, f"consignments_{DOMAIN_PREFIX}.json")
+_consignment_index_lock = threading.Lock()
+def remember_consignment(reference: str, outlet_id: str, consignment_id: str):
+    """
+    Records which consignment was made for an order, so the next sync finds it without a search.
+    """
+    with _consignment_index_lock:
+        try:
+            with open(_consignment_index_path(), encoding="utf-8") as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        index[f"{outlet_id}|{reference}"] = consignment_id
+        os.makedirs(os.path.dirname(_consignment_index_path()), exist_ok=True)
+        _write_json_atomic(_consignment_index_path(), index)
+def find_open_consignment(reference: str, outlet_id: str) -> dict:
+    """
+    Returns the OPEN consignment made earlier for `reference` at `outlet_id`,
+    or None. The local index is tried first (one GET); otherwise the OPEN
+    consignments are searched for the reference.
+    """
+    client = get_client()
+    try:
+        with open(_consignment_index_path(), encoding="utf-8") as f:
+            known_id = json.load(f).get(f"{outlet_id}|{reference}")
+    except (OSError, ValueError):
+        known_id = None
+    if known_id:
+        response = client.get(f"consignments/{known_id}")
+        if response.status_code == 200:
+            data = response.json().get("data") or {}
+            if data.get("status") == "OPEN":
+                return data
+        elif response.status_code != 404:
+            raise LightspeedAPIError(response)
+
+    for batch, _ in client.paginate("consignments", {"type": "SUPPLIER", "status": "OPEN"}):
+        for consignment in batch:
+            if (consignment.get("reference") == reference and consignment.get("status") == "OPEN"
+                    and str(consignment.get("outlet_id")) == str(outlet_id)):
+                remember_consignment(reference, outlet_id, consignment["id"])
+                return consignment
+    return None
+def get_consignment_lines(consignment_id: str) -> pd.DataFrame:
+    """
+    Current lines of a consignment as a DataFrame with 'product_id', 'count' and 'cost'.
+    """
+    lines = []
+    for batch, _ in get_client().paginate(f"consignments/{consignment_id}/products"):
+        lines.extend(batch)
+    df = pd.DataFrame.from_records(
+        [(line.get("product_id"), line.get("count"), line.get("cost")) for line in lines],
+        columns=['product_id', 'count', 'cost'],
+    )
+    return df.astype({'product_id': "string", 'count': "float64", 'cost': "float64"})
+def diff_consignment_lines(current_df: pd.DataFrame, line_items: list) -> dict:
+    """
+    Compares a consignment's current lines with the wanted ones from
+    build_stock_order_lines(), in one merge.
+
+    Wanted lines for the same product are combined (quantities summed, first
+    cost kept). Costs that differ by less than half a cent count as equal.
+
+    Returns:
+        dict: {'add': [...], 'update': [...], 'remove': [product ids], 'unchanged': int}
+              with 'add'/'update' in build_stock_order_lines() form.
+    """
+    wanted = pd.DataFrame.from_records(
+        [(line["product_id"], line["quantity"], line["cost"]) for line in line_items],
+        columns=['product_id', 'quantity', 'cost'],
+    ).astype({'product_id': "string", 'quantity': "float64", 'cost': "float64"})
+    wanted = wanted.groupby('product_id', sort=False).agg(quantity=('quantity', 'sum'), cost=('cost', 'first'))
+    current = current_df.drop_duplicates(subset=['product_id'], keep='last').set_index('product_id')
+
+    merged = current.join(wanted, how='outer', lsuffix='_current')
+    in_current = merged['count'].notna()
+    in_wanted = merged['quantity'].notna()
+    changed = (merged['count'] != merged['quantity']) | ((merged['cost_current'].fillna(0) - merged['cost']).abs() >= 0.005)
+
+    def as_lines(rows):
+        return [{"product_id": pid, "quantity": int(quantity), "cost": float(cost)}
+                for pid, quantity, cost in zip(rows.index, rows['quantity'], rows['cost'])]
+
+    return {
+        "add": as_lines(merged[in_wanted & ~in_current]),
+        "update": as_lines(merged[in_wanted & in_current & changed]),
+        "remove": merged.index[in_current & ~in_wanted].tolist(),
+        "unchanged": int((in_wanted & in_current & ~changed).sum()),
+    }
+def sync_consignment_lines(consignment_id: str, line_items: list, max_workers: int = None,
+                           dry_run: bool = None) -> dict:
+    """
+    Makes a consignment's lines match `line_items` with as few calls as
+    possible: one GET for the current lines, then only the POSTs, PUTs and
+    DELETEs the diff calls for.
+
+    Returns:
+        dict: {'stock_order_id', 'added', 'updated', 'removed', 'unchanged',
+               'failed': list of {'line' or 'product_id', 'status', 'error'}}
+    """
+    diff = diff_consignment_lines(get_consignment_lines(consignment_id), line_items)
+    result = {"stock_order_id": consignment_id, "added": [], "updated": [], "removed": [],
+              "unchanged": diff["unchanged"], "failed": []}
+    print(f"Consignment {consignment_id}: {len(diff['add'])} to add, {len(diff['update'])} to update, "
+          f"{len(diff['remove'])} to remove, {diff['unchanged']} unchanged.")
+    if is_dry_run(dry_run):
+        result.update(added=diff["add"], updated=diff["update"], removed=diff["remove"], status="simulated")
+        return result
+
+    client = get_client()
+    url_base = f"consignments/{consignment_id}/products"
+
+    def apply_change(change):
+        action, item = change
+        try:
+            if action == "update":
+                response = client.put(f"{url_base}/{item['product_id']}",
+                                      json={"count": item["quantity"], "cost": item["cost"]})
+            else:
+                response = client.delete(f"{url_base}/{item}")
+        except (requests.ConnectionError, requests.Timeout) as e:
+            return action, item, {"status": None, "error": f"{e.__class__.__name__}: {e}"}
+        if response.status_code in (200, 201, 204):
+            return action, item, None
+        return action, item, {"status": response.status_code, "error": response.text}
+
+    changes = [("update", line) for line in diff["update"]] + [("remove", pid) for pid in diff["remove"]]
+    for action, item, failure in parallel_map(apply_change, changes, max_workers or LINE_WORKERS) if changes else []:
+        if failure:
+            key = "line" if action == "update" else "product_id"
+            result["failed"].append({key: item, **failure})
+        else:
+            result["updated" if action == "update" else "removed"].append(item)
+
+    if diff["add"]:
+        added = add_products_to_stock_order(consignment_id, diff["add"], max_workers=max_workers, dry_run=dry_run)
+        result["added"] = added["added"]
+        result["failed"].extend(added["failed"])
+    return result
+def load_outlet_split(spec) -> dict:
+    """
+    Reads how each Faire order is shared between outlets.
+
+    `spec` is a dict, "outlet_id=value,..." text or the path of a CSV table
+    with an 'outlet_id' column and a 'ratio' and/or 'column' column. A
+    number is the outlet's share of every line; anything else names a column
+    of the Faire CSV that holds the outlet's quantity per line.
+
+    Returns:
+        dict: {outlet_id: ratio (float) or split column name (str)}, in the
+              order given. Empty when `spec` is empty.
+    """
+    if not spec:
+        return {}
+    if isinstance(spec, dict):
+        items = list(spec.items())
+    elif os.path.isfile(spec):
+        table = pd.read_csv(spec, dtype="string")
+        table.columns = table.columns.str.strip().str.lower()
+        if 'outlet_id' not in table.columns or not {'ratio', 'column'} & set(table.columns):
+            raise ValueError(f"{spec}: an outlet split table needs 'outlet_id' and 'ratio' or 'column' columns.")
+        items = []
+        for row in table.to_dict('records'):
+            column = row.get('column')
+            items.append((row['outlet_id'], column if pd.notna(column) else row.get('ratio')))
+    else:
+        items = []
+        for part in str(spec).split(","):
+            if not part.strip():
+                continue
+            if "=" not in part:
+                raise ValueError(f"Outlet split entry '{part.strip()}' is not outlet_id=ratio or outlet_id=column.")
+            items.append(tuple(part.split("=", 1)))
+
+    split = {}
+    for outlet_id, value in items:
+        outlet_id = str(outlet_id).strip()
+        value = str(value).strip() if value is not None and pd.notna(value) else ""
+        if not outlet_id or not value:
+            raise ValueError(f"Outlet split entry for '{outlet_id}' needs an outlet id and a ratio or column.")
+        try:
+            ratio = float(value)
+        except ValueError:
+            split[outlet_id] = value
+            continue
+        if not ratio >= 0:
+            raise ValueError(f"Outlet split ratio for {outlet_id} must not be negative.")
+        split[outlet_id] = ratio
+    ratios = [v for v in split.values() if not isinstance(v, str)]
+    if ratios and not sum(ratios):
+        raise ValueError("Outlet split ratios add up to 0.")
+    return split
+def outlet_split_columns(split: dict) -> list:
+    """
+    The Faire CSV columns an outlet split reads quantities from.
+    """
+    return [value for value in (split or {}).values() if isinstance(value, str)]
+def allocate_order_lines(order_df: pd.DataFrame, split: dict) -> dict:
+    """
+    Shares an order's lines between outlets.
+
+    Outlets with a split column get that column's quantity of each line.
+    What is left of 'Quantity' after that is shared between the ratio
+    outlets by largest remainder: each gets the whole part of its share and
+    the leftover units go to the largest fractions (ties to the outlet listed
+    first), so a line's outlet quantities always add up to what was left.
+
+    Returns:
+        dict: {outlet_id: the rows of order_df the outlet gets, with its own
+               'Quantity'}. Lines an outlet gets none of are left out.
+    """
+    quantity = _numeric_column(order_df['Quantity']).fillna(0).to_numpy()
+    allocated = {}
+    for outlet_id, column in split.items():
+        if isinstance(column, str):
+            if column not in order_df.columns:
+                raise ValueError(f"Split column '{column}' for outlet {outlet_id} is not in the order.")
+            allocated[outlet_id] = _numeric_column(order_df[column]).fillna(0).clip(lower=0).round().to_numpy()
+
+    ratio_outlets = [outlet_id for outlet_id, value in split.items() if not isinstance(value, str)]
+    if ratio_outlets:
+        rest = np.clip(quantity - sum(allocated.values(), np.zeros(len(order_df))), 0, None)
+        weights = np.array([split[outlet_id] for outlet_id in ratio_outlets], dtype=float)
+        exact = np.outer(rest, weights / weights.sum())
+        shares = np.floor(exact + 1e-9)
+        leftover = (rest - shares.sum(axis=1)).round()
+        # Rank each line's fractions; the top `leftover` outlets get one more unit
+        ranks = np.argsort(np.argsort(-(exact - shares), axis=1, kind='stable'), axis=1, kind='stable')
+        shares += ranks < leftover[:, None]
+        for i, outlet_id in enumerate(ratio_outlets):
+            allocated[outlet_id] = shares[:, i]
+
+    lines = {}
+    for outlet_id in split:
+        keep = allocated[outlet_id] > 0
+        lines[outlet_id] = order_df[keep].assign(
+            Quantity=pd.array(allocated[outlet_id][keep].astype(int), dtype="Int32"))
+    return lines
+def file_digest(file_path: str) -> str:
+    """
+    SHA-256 of a file's contents, so a journal follows the order, not its file name.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+class OrderJournal:
+    """
+    Durable record of the steps already done for one Faire order file, so a
+    rerun after a crash resumes instead of starting over.
+
+    Stored as JSON under CACHE_DIR/journal/, keyed by the file's content hash
+    and the outlet. Each step is written (atomically) as soon as it succeeds:
+    products created (SKU/brand -> id), the consignment id and every line
+    added. Nothing is written in dry-run mode.
+    """
+    def __init__(self, file_path: str, outlet_id: str, directory: str = None, dry_run: bool = None,
+                 digest: str = None):
+        self.file_path = file_path
+        self.digest = digest or file_digest(file_path)
+        directory = directory or os.path.join(CACHE_DIR, "journal")
+        self.path = os.path.join(directory, f"{self.digest[:32]}-{outlet_id}.json")
+        self.enabled = not is_dry_run(dry_run)
+        self.lock = threading.Lock()
+        self.data = {
+            "file": os.path.basename(file_path), "sha256": self.digest, "outlet_id": outlet_id,
+            "created": {}, "stock_order_id": None, "lines_added": [], "completed_at": None,
+        }
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self.data.update(json.load(f))
+        except (OSError, ValueError):
+            pass
+        self._lines_added = set(self.data["lines_added"])
+
+    @staticmethod
+    def product_key(sku, brand_name) -> str:
+        return f"{sku}\x1f{brand_name}"
+
+    @property
+    def resumed(self) -> bool:
+        return bool(self.data["created"] or self.data["stock_order_id"] or self.data["lines_added"])
+
+    @property
+    def completed(self) -> bool:
+        return bool(self.data["completed_at"])
+
+    @property
+    def stock_order_id(self):
+        return self.data["stock_order_id"]
+
+    def created_ids(self) -> dict:
+        """
+        {(SKU, brand name): product id} for products this order already created.
+        """
+        return {tuple(key.split("\x1f", 1)): pid for key, pid in self.data["created"].items()}
+
+    def is_line_added(self, product_id) -> bool:
+        return str(product_id) in self._lines_added
+
+    def _save(self):
+        if not self.enabled:
+            return
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.data["updated_at"] = time.time()
+        _write_json_atomic(self.path, self.data)
+
+    def record_created(self, sku, brand_name, product_id):
+        with self.lock:
+            self.data["created"][self.product_key(sku, brand_name)] = product_id
+            self._save()
+
+    def record_stock_order(self, stock_order_id):
+        with self.lock:
+            self.data["stock_order_id"] = stock_order_id
+            self._save()
+
+    def record_line(self, product_id):
+        with self.lock:
+            self._lines_added.add(str(product_id))
+            self.data["lines_added"].append(str(product_id))
+            self._save()
+
+    def complete(self):
+        with self.lock:
+            self.data["completed_at"] = time.time()
+            self._save()
+
+    def archive(self) -> str:
+        """
+        Moves a finished journal to journal/archive/ and starts this one
+        afresh, so the order is processed again as a new stock order.
+        Returns the archived file's path (None in dry-run mode).
+        """
+        with self.lock:
+            archived = None
+            if self.enabled and os.path.exists(self.path):
+                directory = os.path.join(os.path.dirname(self.path), "archive")
+                os.makedirs(directory, exist_ok=True)
+                stem = os.path.splitext(os.path.basename(self.path))[0]
+                archived = os.path.join(directory, f"{stem}-{datetime.now():%Y%m%d-%H%M%S-%f}.json")
+                os.replace(self.path, archived)
+            self.data.update(created={}, stock_order_id=None, lines_added=[], completed_at=None)
+            self._lines_added = set()
+            return archived
+def process_faire_orders(file_paths: list, outlet_id: str, log=print, registry: SupplierBrandRegistry = None,
+                         products_df: pd.DataFrame = None, dry_run: bool = None, sync: bool = False,
+                         split: dict = None, reprocess: bool = False) -> dict:
+    """
+    Turns one or more Faire order CSVs into Lightspeed stock orders.
+
+    The catalog and the supplier/brand lists are consulted once for the whole
+    batch, all orders are matched in a single merge and each missing SKU is
+    created once even if several orders contain it. One consignment is then
+    created per order, or per order and outlet when the order is split.
+
+    Args:
+        file_paths (list): Faire order CSV paths.
+        outlet_id (str): Lightspeed outlet receiving the stock.
+        log (callable): Progress messages go here.
+        registry (SupplierBrandRegistry): Supplier/brand lookup (a fresh one by default).
+        products_df (pd.DataFrame): Catalog snapshot to match against. If not given the
+            local catalog is used and resolve_order_products() looks up the rest.
+        dry_run (bool): Simulate every write (None uses DRY_RUN). Lookups still
+            use the API; plan_faire_orders() is the offline preview.
+        sync (bool): Update the order's existing OPEN consignment (found by
+            consignment_reference()) to match the file, sending only the
+            changed lines, instead of always creating a new one.
+        split (dict): Share every order between these outlets instead of
+            sending it all to `outlet_id` (see load_outlet_split() and
+            allocate_order_lines()). Products are resolved once; the outlets'
+            consignments are then built at the same time.
+        reprocess (bool): Archive the journals of orders already completed
+            and process them again, instead of skipping them. Interrupted
+            orders still resume.
+
+    Returns:
+        dict: {'orders': list of per-order (per outlet when split) results, 'lines': int,
+               'created': int, 'elapsed': seconds, 'lines_per_second': float}
+    """
+    dry_run = is_dry_run(dry_run)
+    started = time.perf_counter()
+    metrics = start_run_metrics("faire-batch" if len(file_paths) > 1 else "faire-order")
+    registry = registry or new_supplier_brand_registry()
+    outlets = list(split) if split else [outlet_id]
+    split_columns = outlet_split_columns(split)
+
+    def order_label(path, outlet):
+        name = os.path.basename(path)
+        return f"{name} [{outlet}]" if split else name
+
+    log(f"Reading {len(file_paths)} Faire order file(s)...")
+    if split:
+        log(f"Splitting orders between {len(outlets)} outlets: "
+            + ", ".join(f"{o} ({v if isinstance(v, str) else f'{v:g}'})" for o, v in split.items()))
+    orders = {}
+    journals = {}
+    completed = []
+    for path in file_paths:
+        with metrics.stage("read"):
+            order_df, report = read_faire_order_lines(path, sum_columns=split_columns)
+            absent = [col for col in split_columns if col not in order_df.columns]
+        for problem in report.itertuples(index=False):
+            log(f"⚠️ {os.path.basename(path)} row {problem.row + 2} (SKU {problem.SKU}): "
+                f"{problem.problem}, {problem.action}.")
+        if order_df.empty:
+            log(f"⚠️ {os.path.basename(path)}: no order lines, skipped.")
+            continue
+        if absent:
+            error = f"split column(s) {', '.join(absent)} not found"
+            log(f"❌ {os.path.basename(path)}: {error}.")
+            completed.append({"file": path, "outlet_id": None, "brand": get_first_brand_name(order_df), "lines": 0,
+                              "stock_order_id": None, "added": 0, "failed": 0, "well_stocked": [],
+                              "error": error})
+            continue
+        digest = file_digest(path)
+        file_journals = {outlet: OrderJournal(path, outlet, dry_run=dry_run, digest=digest) for outlet in outlets}
+        if reprocess:
+            for outlet, journal in file_journals.items():
+                if journal.completed:
+                    previous = journal.stock_order_id
+                    archived = journal.archive()
+                    log(f"{order_label(path, outlet)}: reprocessing although already done as stock order "
+                        f"{previous}" + (f" (journal archived to {archived})." if archived else "."))
+        if all(journal.completed for journal in file_journals.values()):
+            for outlet, journal in file_journals.items():
+                log(f"{order_label(path, outlet)}: already done as stock order {journal.stock_order_id}, skipped "
+                    f"(journal {journal.path}).")
+                completed.append({"file": path, "outlet_id": outlet, "brand": get_first_brand_name(order_df),
+                                  "lines": 0, "stock_order_id": journal.stock_order_id, "added": 0, "failed": 0,
+                                  "well_stocked": [], "error": None, "skipped": True})
+            continue
+        if any(journal.resumed for journal in file_journals.values()):
+            log(f"{os.path.basename(path)}: resuming an interrupted run from its journal.")
+        journals.update({(path, outlet): journal for outlet, journal in file_journals.items()})
+        orders[path] = order_df.assign(order_file=path)
+
+    summary = {"orders": completed, "lines": 0, "created": 0, "elapsed": 0.0, "lines_per_second": 0.0,
+               "report": None, "report_path": None}
+    if not orders:
+        return summary
+
+    log("Matching products...")
+    all_orders_df = pd.concat(orders.values(), ignore_index=True)
+    if products_df is None:
+        # Match against the local catalog, then resolve the rest the cheapest way
+        catalog = get_catalog_cache()
+        existing_df, missing_df, _ = resolve_order_products(all_orders_df, catalog, log=log)
+        if DEBUG_PRODUCTS_CSV:
+            catalog.export_csv(DEBUG_PRODUCTS_CSV)
+            log(f"Catalog exported to {DEBUG_PRODUCTS_CSV}")
+    else:
+        with metrics.stage("match"):
+            existing_df, missing_df = match_products_and_find_missing(products_df, all_orders_df)
+
+    # Products an interrupted run already created are taken from the journals
+    # (keyed by product_key(), like the catalog, so case/whitespace variants share one product)
+    created_ids = {}
+    for journal in journals.values():
+        created_ids.update({product_key(*key): pid for key, pid in journal.created_ids().items()})
+    missing_keys = pd.Series(product_keys(missing_df['SKU'], missing_df['Brand Name']), index=missing_df.index,
+                             dtype=object)
+    key_files = defaultdict(set)
+    for key, path in zip(missing_keys, missing_df['order_file']):
+        key_files[key].add(path)
+
+    def journal_created(record):
+        key = product_key(record["supplier_code"], record["Brand Name"])
+        for path in key_files.get(key, ()):
+            for outlet in outlets:
+                journals[(path, outlet)].record_created(str(record["supplier_code"]), str(record["Brand Name"]),
+                                                        record["id"])
+
+    # Create each missing (SKU, brand) once, grouped by brand for supplier/brand ids
+    unique_missing = missing_df[~missing_keys.duplicated()]
+    already_created = missing_keys[unique_missing.index].map(lambda key: key in created_ids).astype(bool)
+    to_create = unique_missing[~already_created]
+    if len(to_create) < len(unique_missing):
+        log(f"{len(unique_missing) - len(to_create)} missing products were already created by an earlier run.")
+    log(f"Found {len(to_create)} missing products. Creating them...")
+    # A brand that can't be resolved (e.g. a near-match under the "error" policy) only fails its own orders
+    failed_files = {}
+    with metrics.stage("create"):
+        for brand_name, brand_missing in to_create.groupby('Brand Name', sort=False, observed=True):
+            try:
+                records = create_missing_products(brand_missing, registry=registry, on_created=journal_created,
+                                                  dry_run=dry_run, outlet_id=outlet_id, outlet_ids=outlets)
+            except Exception as e:
+                log(f"❌ Could not create products for brand {brand_name}: {e}")
+                for key in missing_keys[brand_missing.index]:
+                    for path in key_files.get(key, ()):
+                        failed_files.setdefault(path, f"brand {brand_name}: {e}")
+                continue
+            for record in records:
+                created_ids[product_key(record["supplier_code"], record["Brand Name"])] = record["id"]
+                summary["created"] += 1
+
+    if not missing_df.empty:
+        missing_df = missing_df.assign(id=[created_ids.get(key) for key in missing_keys], supplier_code=missing_df['SKU'])
+    resolved_df = pd.concat([existing_df, missing_df.dropna(subset=['id'])], ignore_index=True)
+
+    inventory = None
+    if INVENTORY_CHECK and not existing_df.empty:
+        inventory = get_inventory_snapshot()
+        try:
+            with metrics.stage("inventory_sync"):
+                fetched = inventory.sync()
+            log(f"Inventory synced: {fetched} changed records ({len(inventory)} in snapshot).")
+        except (requests.RequestException, LightspeedAPIError) as e:
+            log(f"⚠️ Could not sync inventory, stock levels may be out of date: {e}")
+
+    def fulfil(path, order_df, outlet, outlet_lines):
+        name = order_label(path, outlet)
+        journal = journals[(path, outlet)]
+        order_result = {"file": path, "outlet_id": outlet, "brand": get_first_brand_name(order_df), "lines": 0,
+                        "stock_order_id": None, "added": 0, "failed": 0, "well_stocked": [], "error": None}
+        if journal.completed:
+            log(f"{name}: already done as stock order {journal.stock_order_id}, skipped.")
+            order_result.update(stock_order_id=journal.stock_order_id, skipped=True)
+            return order_result
+        if path in failed_files:
+            order_result["error"] = f"Products could not be created for {failed_files[path]}"
+            log(f"❌ {name}: {order_result['error']}")
+            return order_result
+        try:
+            combined_df = combine_product_ids(outlet_lines, [])
+            if inventory is not None:
+                well_stocked = find_well_stocked(combined_df, outlet)
+                order_result["well_stocked"] = well_stocked['supplier_code'].astype(str).tolist()
+                for line in well_stocked.itertuples(index=False):
+                    log(f"⚠️ {name}: reordering {line.supplier_code} although {line.on_hand} are already on hand.")
+
+            reference = consignment_reference(order_df, path)
+            stock_order = None
+            if journal.stock_order_id:
+                stock_order = {"id": journal.stock_order_id}
+                log(f"{name}: continuing stock order {stock_order['id']} from the journal.")
+            elif sync:
+                with metrics.stage("find_consignment"):
+                    stock_order = find_open_consignment(reference, outlet)
+                if stock_order:
+                    journal.record_stock_order(stock_order["id"])
+                    log(f"{name}: updating open stock order {stock_order['id']} ({reference}).")
+            if not stock_order and combined_df.empty:
+                log(f"{name}: nothing allocated to this outlet, no stock order needed.")
+                journal.complete()
+                return order_result
+            if not stock_order:
+                log(f"{name}: creating stock order shell...")
+                with metrics.stage("shell"):
+                    stock_order = create_stock_order_shell(location_id=outlet, faire_df=order_df, registry=registry,
+                                                           dry_run=dry_run, reference=reference)
+                if not (stock_order and "id" in stock_order):
+                    order_result["error"] = "Failed to create stock order."
+                    log(f"❌ {name}: failed to create stock order.")
+                    return order_result
+                journal.record_stock_order(stock_order["id"])
+                log(f"{name}: stock order created with ID: {stock_order['id']}")
+            order_result["stock_order_id"] = stock_order["id"]
+
+            with metrics.stage("build_lines"):
+                line_items = build_stock_order_lines(combined_df)
+            order_result["lines"] = len(line_items)
+            if sync:
+                # The consignment's own lines are the checkpoint here, so the journal's line list isn't needed
+                with metrics.stage("sync_lines"):
+                    result = sync_consignment_lines(stock_order["id"], line_items, dry_run=dry_run)
+                order_result.update(added=len(result["added"]), updated=len(result["updated"]),
+                                    removed=len(result["removed"]), unchanged=result["unchanged"])
+                log(f"{name}: {len(result['added'])} lines added, {len(result['updated'])} updated, "
+                    f"{len(result['removed'])} removed, {result['unchanged']} unchanged.")
+            else:
+                pending = [line for line in line_items if not journal.is_line_added(line["product_id"])]
+                if len(pending) < len(line_items):
+                    log(f"{name}: {len(line_items) - len(pending)} lines were already added by an earlier run.")
+                log(f"{name}: adding {len(pending)} products to stock order...")
+                with metrics.stage("insert_lines"):
+                    result = add_products_to_stock_order(stock_order["id"], pending, dry_run=dry_run,
+                                                         on_added=lambda line: journal.record_line(line["product_id"]))
+                order_result["added"] = len(line_items) - len(pending) + len(result["added"])
+            order_result["failed"] = len(result["failed"])
+
+            if result["failed"]:
+                failed_ids = ", ".join(str(f["line"]["product_id"] if "line" in f else f["product_id"])
+                                       for f in result["failed"])
+                log(f"⚠️ {name}: {len(result['failed'])} lines could not be added: {failed_ids}")
+            else:
+                journal.complete()
+                log(f"✅ {name}: stock order completed successfully.")
+        except Exception as e:
+            order_result["error"] = str(e)
+            log(f"❌ {name}: {e}")
+        return order_result
+
+    for path, order_df in orders.items():
+        file_lines = resolved_df[resolved_df['order_file'] == path]
+        if split:
+            allocations = allocate_order_lines(file_lines, split)
+            unallocated = int(_numeric_column(file_lines['Quantity']).sum()
+                              - sum(int(lines['Quantity'].sum()) for lines in allocations.values()))
+            if unallocated:
+                log(f"⚠️ {os.path.basename(path)}: the split columns leave {abs(unallocated)} units "
+                    f"{'unallocated' if unallocated > 0 else 'more than were ordered'}.")
+        else:
+            allocations = {outlet_id: file_lines}
+        # The outlets' consignments only share the resolved products, so they are built side by side
+        results = parallel_map(lambda outlet: fulfil(path, order_df, outlet, allocations[outlet]), outlets,
+                               max_workers=len(outlets))
+        summary["orders"].extend(results)
+        summary["lines"] += sum(result["lines"] for result in results)
+
+    summary["elapsed"] = time.perf_counter() - started
+    if summary["elapsed"]:
+        summary["lines_per_second"] = summary["lines"] / summary["elapsed"]
+
+    metrics.info.update({
+        "near_match": near_match_settings(),
+        "orders": summary["orders"],
+        "lines": summary["lines"],
+        "created": summary["created"],
+        "lines_per_second": round(summary["lines_per_second"], 2),
+    })
+    summary["report"] = metrics.summary()
+    try:
+        summary["report_path"] = metrics.write_report()
+    except OSError as e:
+        log(f"⚠️ Could not write run report: {e}")
+    return summary
+def process_faire_order(file_path: str, outlet_id: str, log=print, registry: SupplierBrandRegistry = None,
+                        products_df: pd.DataFrame = None, dry_run: bool = None, sync: bool = False,
+                        split: dict = None, reprocess: bool = False) -> dict:
+    """
+    Processes a single Faire order CSV. Returns that order's result from process_faire_orders().
+    With a split, every outlet's result is under 'outlets' and their errors and
+    failed lines are folded into the top-level 'error' and 'failed'.
+    """
+    summary = process_faire_orders([file_path], outlet_id, log=log, registry=registry, products_df=products_df,
+                                   dry_run=dry_run, sync=sync, split=split, reprocess=reprocess)
+    if not summary["orders"]:
+        return {"file": file_path, "error": "No order lines found."}
+    result = dict(summary["orders"][0])
+    if len(summary["orders"]) > 1:
+        result.update(outlets=summary["orders"],
+                      error="; ".join(o["error"] for o in summary["orders"] if o["error"]) or None,
+                      failed=sum(o["failed"] for o in summary["orders"]))
+    return result
+PLAN_FORMAT = 1
+def _plan_brand(registry: SupplierBrandRegistry, name: str) -> dict:
+    """
+    Supplier/brand decision for one brand name, from the registry alone.
+    """
+    entry = {"name": name, "supplier_id": None, "brand_id": None,
+             "create_supplier": False, "create_brand": False, "problem": None}
+    for kind, find, near in (("supplier", registry.find_supplier, registry.near_suppliers),
+                             ("brand", registry.find_brand, registry.near_brands)):
+        try:
+            record = find(name) or _resolve_near_match(kind, name, near(name))
+        except ValueError as e:
+            entry["problem"] = str(e)
+            continue
+        if record:
+            entry[f"{kind}_id"] = record["id"]
         else:
-            # print(response.status_code)
-            print(f"Error adding product {line['product_id']} to stock order: {response.text}")
+            entry[f"create_{kind}"] = True
+    return entry
+def plan_faire_orders(file_paths: list, outlet_id: str, log=print, catalog: CatalogCache = None,
+                      registry: SupplierBrandRegistry = None, split: dict = None) -> dict:
+    """
+    Works out everything process_faire_orders() would do without making a
+    single API call: which suppliers, brands and products have to be created
+    and the consignment lines (with costs) for every order.
+
+    Products are matched against the local catalog as last synced and names
+    against the saved supplier/brand registry, so the plan is only as fresh as
+    those caches. apply_plan() re-checks the catalog before creating anything.
+
+    With `split` (see load_outlet_split()) every order is shared between the
+    outlets as process_faire_orders() would, giving one planned consignment
+    per order and outlet.
+
+    Returns:
+        dict: JSON-serializable plan with 'sources', 'brands',
+              'products_to_create', 'orders', 'problems' and 'totals'.
+    """
+    started = time.perf_counter()
+    if catalog is None:
+        catalog = get_catalog_cache()
+    if registry is None:
+        registry = SupplierBrandRegistry()
+    registry.load(offline=True)
+
+    problems = []
+    frames = []
+    unreadable = set()
+    split_columns = outlet_split_columns(split)
+    for path in file_paths:
+        # Each file is read a chunk at a time and arrives already cleaned and folded
+        df, report = read_faire_order_lines(path, sum_columns=split_columns)
+        problems.extend(f"{os.path.basename(path)} row {problem.row + 2} (SKU {problem.SKU}): "
+                        f"{problem.problem}, {problem.action}" for problem in report.itertuples(index=False))
+        absent = [col for col in split_columns if col not in df.columns]
+        if absent and not df.empty:
+            problems.append(f"{os.path.basename(path)}: split column(s) {', '.join(absent)} not found")
+            unreadable.add(path)
+        elif not df.empty:
+            frames.append(df.assign(order_file=path))
+    orders = {}
+    if frames:
+        batch_df = pd.concat(frames, ignore_index=True)
+        batch_df['Brand Name'] = batch_df['Brand Name'].astype("string").astype("category")
+        orders = dict(tuple(batch_df.groupby('order_file', sort=False)))
+    problems.extend(f"{os.path.basename(path)}: no order lines" for path in file_paths
+                    if path not in orders and path not in unreadable)
+
+    plan = {
+        "format": PLAN_FORMAT,
+        "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "outlet_id": outlet_id,
+        "split": split,
+        "sources": {
+            "catalog_products": len(catalog),
+            "catalog_synced_at": catalog.synced_at,
+            "registry_loaded_at": registry.loaded_at,
+        },
+        "brands": [],
+        "products_to_create": [],
+        "orders": [],
+        "problems": problems,
+        "totals": {"orders": 0, "lines": 0, "units": 0, "cost": 0.0, "products_to_create": 0},
+    }
+    if not catalog.synced_at:
+        problems.append("The local catalog has never been fully synced; products may be planned for creation "
+                        "that already exist.")
+    if registry.loaded_at is None:
+        problems.append("No saved supplier/brand list; every brand is planned as new.")
+    if not orders:
+        return plan
+
+    all_orders_df = batch_df
+    existing_df, missing_df = match_catalog_products(all_orders_df, catalog, log=log)
+
+    brand_names = all_orders_df['Brand Name'].astype(str).unique().tolist()
+    brands = {name: _plan_brand(registry, name) for name in brand_names}
+    plan["brands"] = list(brands.values())
+    problems.extend(f"{name}: {entry['problem']}" for name, entry in brands.items() if entry["problem"])
+
+    unique_missing = missing_df[~pd.Series(product_keys(missing_df['SKU'], missing_df['Brand Name']),
+                                           index=missing_df.index, dtype=object).duplicated()]
+    for brand_name, brand_missing in unique_missing.groupby('Brand Name', sort=False, observed=True):
+        # Supplier/brand ids are filled in by apply_plan() once they exist
+        for payload in build_product_payloads(brand_missing, None, None, outlet_id=outlet_id,
+                                              outlet_ids=list(split) if split else None):
+            plan["products_to_create"].append({"brand": str(brand_name), "payload": payload})
+
+    lines_df = pd.concat([
+        existing_df.assign(product_id=existing_df['id']),
+        missing_df.assign(product_id=None),
+    ], ignore_index=True)
+    lines_df = lines_df.assign(cost=_numeric_column(lines_df['Wholesale Price']).fillna(0.0))
+    lines_by_file = dict(tuple(lines_df.groupby('order_file', sort=False)))
+    for path, order_df in orders.items():
+        file_lines = lines_by_file[path]
+        if split:
+            allocations = allocate_order_lines(file_lines, split)
+            unallocated = int(_numeric_column(file_lines['Quantity']).sum()
+                              - sum(int(lines['Quantity'].sum()) for lines in allocations.values()))
+            if unallocated:
+                problems.append(f"{os.path.basename(path)}: the split columns leave {abs(unallocated)} units "
+                                f"{'unallocated' if unallocated > 0 else 'more than were ordered'}")
+        else:
+            allocations = {outlet_id: file_lines}
+        digest = file_digest(path)
+        for outlet, order_lines in allocations.items():
+            if order_lines.empty:
+                continue
+            quantities = _numeric_column(order_lines['Quantity']).fillna(0).astype(int)
+            lines = [
+                {"sku": str(sku), "brand": str(brand), "product_id": None if pd.isna(pid) else str(pid),
+                 "quantity": int(quantity), "cost": float(cost)}
+                for sku, brand, pid, quantity, cost in zip(order_lines['SKU'], order_lines['Brand Name'],
+                                                           order_lines['product_id'], quantities,
+                                                           order_lines['cost'])
+            ]
+            plan["orders"].append({
+                "file": path,
+                "outlet_id": outlet,
+                "sha256": digest,
+                "reference": consignment_reference(order_df, path),
+                "brand": get_first_brand_name(order_df),
+                "lines": lines,
+                "units": int(quantities.sum()),
+                "cost": round(float((quantities * order_lines['cost']).sum()), 2),
+            })
+
+    totals = plan["totals"]
+    totals["orders"] = len(plan["orders"])
+    totals["lines"] = sum(len(o["lines"]) for o in plan["orders"])
+    totals["units"] = sum(o["units"] for o in plan["orders"])
+    totals["cost"] = round(sum(o["cost"] for o in plan["orders"]), 2)
+    totals["products_to_create"] = len(plan["products_to_create"])
+    plan["seconds"] = round(time.perf_counter() - started, 3)
+    log(format_plan(plan))
+    return plan
+def format_plan(plan: dict) -> str:
+    """
+    Human-readable summary of a plan from plan_faire_orders().
+    """
+    totals = plan["totals"]
+    text = [f"Plan for {totals['orders']} orders: {totals['lines']} lines, {totals['units']} units, "
+            f"cost {totals['cost']:.2f}; {totals['products_to_create']} products to create."]
+    for brand in plan["brands"]:
+        creates = [kind for kind in ("supplier", "brand") if brand[f"create_{kind}"]]
+        if creates:
+            text.append(f"  {brand['name']}: create {' and '.join(creates)}")
+    for order in plan["orders"]:
+        new = sum(1 for line in order["lines"] if line["product_id"] is None)
+        outlet = f" [{order['outlet_id']}]" if plan.get("split") else ""
+        text.append(f"  {os.path.basename(order['file'])}{outlet} ({order['brand']}): {len(order['lines'])} lines, "
+                    f"{new} new products, cost {order['cost']:.2f}")
+    text.extend(f"  ⚠️ {problem}" for problem in plan["problems"])
+    return "\n".join(text)
+def save_plan(plan: dict, path: str):
+    _write_json_atomic(path, plan)
+def load_plan(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        plan = json.load(f)
+    if plan.get("format") != PLAN_FORMAT:
+        raise ValueError(f"{path} is not a plan this version can apply (format {plan.get('format')}).")
+    return plan
+def apply_plan(plan: dict, log=print, registry: SupplierBrandRegistry = None, max_workers: int = None,
+               dry_run: bool = None, reprocess: bool = False) -> dict:
+    """
+    Carries out a plan from plan_faire_orders() with as much concurrency as
+    the API allows: suppliers/brands first, then every new product at once,
+    then all consignments and their lines in parallel.
+
+    The catalog is synced first, so products that appeared since the plan was
+    made are used instead of created twice. Order journals are kept as in
+    process_faire_orders(), so an interrupted apply can simply be rerun.
 
-    print(f"Added {len(results)} products to stock order {stock_order_id}")
-    return results
+    Brands the plan flagged as problems (e.g. an ambiguous near match) are not
+    created; orders with lines of those brands are skipped and listed, with the
+    reason, under 'flagged_brands' in the summary.
+
+    With reprocess=True, orders already completed are applied again (their
+    journals archived first), as in process_faire_orders().
+
+    Returns:
+        dict: Same shape as process_faire_orders(), plus 'flagged_brands'.
+    """
+    dry_run = is_dry_run(dry_run)
+    started = time.perf_counter()
+    metrics = start_run_metrics("faire-apply")
+    registry = registry or new_supplier_brand_registry()
+    summary = {"orders": [], "lines": 0, "created": 0, "elapsed": 0.0, "lines_per_second": 0.0,
+               "flagged_brands": {}, "report": None, "report_path": None}
+
+    def order_outlet(order):
+        # Plans made before outlet splits name the outlet only once
+        return order.get("outlet_id") or plan["outlet_id"]
+    flagged = summary["flagged_brands"]
+
+    catalog = get_catalog_cache()
+    with metrics.stage("catalog_sync"):
+        fetched = catalog.sync()
+    log(f"Catalog synced before applying the plan ({fetched} changed products).")
+    # Only the products the plan still has to create are looked up, by product_key()
+    planned_keys = [product_key(item["payload"]["supplier_code"], item["brand"]) for item in plan["products_to_create"]]
+    index, _ = catalog.lookup_keys(planned_keys)
+    known = {key: product["id"] for key, product in index.items()}
+
+    journals = {(order["file"], order_outlet(order)): OrderJournal(order["file"], order_outlet(order),
+                                                                   dry_run=dry_run, digest=order["sha256"])
+                for order in plan["orders"]}
+    for journal in journals.values():
+        if reprocess and journal.completed:
+            previous = journal.stock_order_id
+            journal.archive()
+            log(f"{os.path.basename(journal.file_path)}: reprocessing although already done as stock order "
+                f"{previous}.")
+        known.update({product_key(*key): pid for key, pid in journal.created_ids().items()})
+
+    brand_ids = {}
+    with metrics.stage("suppliers_brands"):
+        for brand in plan["brands"]:
+            if brand.get("problem"):
+                flagged[brand["name"]] = brand["problem"]
+                log(f"⚠️ {brand['name']}: flagged in the plan, its orders are skipped: {brand['problem']}")
+                continue
+            try:
+                brand_ids[brand["name"]] = ensure_supplier_and_brand(brand["name"], dry_run=dry_run,
+                                                                     registry=registry)
+            except Exception as e:
+                flagged[brand["name"]] = f"{e.__class__.__name__}: {e}"
+                log(f"❌ {brand['name']}: could not get supplier/brand, its orders are skipped: {e}")
+
+    to_create = []
+    for item, key in zip(plan["products_to_create"], planned_keys):
+        if key not in known and item["brand"] not in flagged:
+            ids = brand_ids.get(item["brand"], {})
+            to_create.append((key, item["brand"], {**item["payload"], "supplier_id": ids.get("supplier_id"),
+                                                   "brand_id": ids.get("brand_id")}))
+    existing = sum(1 for key in planned_keys if key in known)
+    if existing:
+        log(f"{existing} planned products already exist; not creating them.")
+
+    key_files = defaultdict(set)
+    for order in plan["orders"]:
+        for line in order["lines"]:
+            if line["product_id"] is None:
+                key_files[product_key(line["sku"], line["brand"])].add((order["file"], order_outlet(order)))
+
+    def create_one(item):
+        key, brand, payload = item
+        try:
+            product_id = _created_id(create_product(payload, dry_run=dry_run))
+        except Exception as e:
+            log(f"❌ Could not create SKU {payload['supplier_code']}: {e.__class__.__name__}: {e}")
+            return None
+        for journal_key in key_files.get(key, ()) if product_id else ():
+            journals[journal_key].record_created(str(payload["supplier_code"]), brand, product_id)
+        return product_id
+
+    log(f"Creating {len(to_create)} products...")
+    with metrics.stage("create"):
+        created = parallel_map(create_one, to_create, max(1, min(max_workers or CREATE_WORKERS, len(to_create) or 1)))
+    records = []
+    for (key, brand, payload), product_id in zip(to_create, created):
+        if product_id:
+            known[key] = product_id
+            records.append({"id": product_id, "supplier_code": payload["supplier_code"], "name": payload["name"],
+                            "brand_name": brand, "brand_id": payload["brand_id"], "supplier_id": payload["supplier_id"]})
+    summary["created"] = len(records)
+    if records and not dry_run:
+        catalog.add_created_products(records)
+
+    def apply_order(order):
+        outlet_id = order_outlet(order)
+        name = os.path.basename(order["file"]) + (f" [{outlet_id}]" if plan.get("split") else "")
+        journal = journals[(order["file"], outlet_id)]
+        order_result = {"file": order["file"], "outlet_id": outlet_id, "brand": order["brand"],
+                        "lines": len(order["lines"]),
+                        "stock_order_id": journal.stock_order_id, "added": 0, "failed": 0,
+                        "well_stocked": [], "error": None}
+        if journal.completed:
+            log(f"{name}: already done as stock order {journal.stock_order_id}, skipped.")
+            return {**order_result, "lines": 0, "skipped": True}
+        blocked = sorted({line["brand"] for line in order["lines"]} & flagged.keys())
+        if blocked:
+            order_result["error"] = f"Skipped, brand flagged in the plan: {', '.join(blocked)}."
+            log(f"⚠️ {name}: {order_result['error']}")
+            return {**order_result, "skipped": True}
+        try:
+            line_items = []
+            for line in order["lines"]:
+                product_id = line["product_id"] or known.get(product_key(line["sku"], line["brand"]))
+                if product_id:
+                    line_items.append({"product_id": product_id, "quantity": line["quantity"], "cost": line["cost"]})
+            if len(line_items) < len(order["lines"]):
+                order_result["error"] = f"{len(order['lines']) - len(line_items)} products could not be created."
+            if not journal.stock_order_id:
+                supplier_id = brand_ids.get(order["brand"], {}).get("supplier_id")
+                # Plans saved before references were recorded fall back to the file name
+                reference = order.get("reference") or consignment_reference(pd.DataFrame(), order["file"])
+                stock_order = create_consignment(outlet_id, order["brand"], supplier_id, dry_run=dry_run,
+                                                 reference=reference)
+                if not (stock_order and "id" in stock_order):
+                    order_result["error"] = "Failed to create stock order."
+                    log(f"❌ {name}: failed to create stock order.")
+                    return order_result
+                journal.record_stock_order(stock_order["id"])
+            order_result["stock_order_id"] = journal.stock_order_id
+            pending = [line for line in line_items if not journal.is_line_added(line["product_id"])]
+            result = add_products_to_stock_order(journal.stock_order_id, pending, dry_run=dry_run,
+                                                 on_added=lambda line: journal.record_line(line["product_id"]))
+            order_result["added"] = len(line_items) - len(pending) + len(result["added"])
+            order_result["failed"] = len(result["failed"])
+            if result["failed"]:
+                log(f"⚠️ {name}: {len(result['failed'])} lines could not be added.")
+            elif order_result["error"]:
+                log(f"⚠️ {name}: {order_result['error']}")
+            else:
+                journal.complete()
+                log(f"✅ {name}: stock order {journal.stock_order_id} completed.")
+        except Exception as e:
+            order_result["error"] = str(e)
+            log(f"❌ {name}: {e}")
+        return order_result
+
+    with metrics.stage("orders"):
+        summary["orders"] = parallel_map(apply_order, plan["orders"],
+                                         max(1, min(max_workers or CREATE_WORKERS, len(plan["orders"]) or 1)))
+    summary["lines"] = sum(o["lines"] for o in summary["orders"])
+    summary["elapsed"] = time.perf_counter() - started
+    if summary["elapsed"]:
+        summary["lines_per_second"] = summary["lines"] / summary["elapsed"]
+    metrics.info.update({"near_match": near_match_settings(), "orders": summary["orders"], "lines": summary["lines"],
+                         "created": summary["created"], "flagged_brands": flagged})
+    summary["report"] = metrics.summary()
+    try:
+        summary["report_path"] = metrics.write_report()
+    except OSError as e:
+        log(f"⚠️ Could not write run report: {e}")
+    return summary
+def format_batch_summary(summary: dict) -> str:
+    """
+    One-line throughput summary of process_faire_orders().
+    """
+    orders = summary["orders"]
+    failed = sum(1 for o in orders if o["error"] or o["failed"])
+    return (f"{len(orders)} orders, {summary['lines']} lines, {summary['created']} products created "
+            f"in {summary['elapsed']:.1f}s ({summary['lines_per_second']:.1f} lines/s); "
+            f"{failed} orders need attention.")
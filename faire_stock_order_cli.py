@@ -0,0 +1,240 @@
+"""
+Headless entry point for the Faire -> Lightspeed stock order pipeline.
+
+One-shot mode processes the given Faire CSVs as one batch. With --sync a
+revised export updates the order's open stock order, sending only the
+changed lines:
+    python faire_stock_order_cli.py run order1.csv order2.csv [--sync]
+
+Orders already completed are skipped; --force archives their journals and
+processes them again as new stock orders (run, apply and watch):
+    python faire_stock_order_cli.py run order1.csv --force
+
+--split shares every order between outlets, by ratio or from per-outlet
+quantity columns in the CSV (default: FAIRE_OUTLET_SPLIT). Products are
+resolved once and each outlet gets its own stock order:
+    python faire_stock_order_cli.py --split "OUTLET_A=2,OUTLET_B=1" run order.csv
+    python faire_stock_order_cli.py --split split.csv run order.csv
+
+Plan mode previews a batch without any API calls, using only the local
+catalog and the saved supplier/brand list (and --split, if given); apply
+carries out a saved plan:
+    python faire_stock_order_cli.py plan order1.csv order2.csv --out plan.json
+    python faire_stock_order_cli.py apply plan.json
+
+Watch mode keeps running, picks up new CSVs dropped into a folder and
+works through them with a small pool of workers. The catalog cache and the
+supplier/brand registry stay warm between orders, so each order only costs
+its own API calls. Finished files are moved to processed/ or failed/.
+    python faire_stock_order_cli.py watch /path/to/inbox --workers 2
+"""
+import argparse
+import os
+import queue
+import shutil
+import sys
+import threading
+import time
+from datetime import datetime
+from dotenv import load_dotenv
+load_dotenv()
+from faireOrderFuncs import (
+    process_faire_orders, process_faire_order, format_batch_summary, SupplierBrandRegistry,
+    plan_faire_orders, save_plan, load_plan, apply_plan, load_outlet_split
+)
+
+
+def print_summary(summary: dict) -> int:
+    print(format_batch_summary(summary))
+    if summary["report"]:
+        print(summary["report"])
+    if summary["report_path"]:
+        print(f"Run report saved to {summary['report_path']}")
+    failed = [o for o in summary["orders"] if o["error"] or o["failed"]]
+    return 1 if failed or not summary["orders"] else 0
+
+
+def run_once(args) -> int:
+    return print_summary(process_faire_orders(args.files, args.outlet, sync=args.sync, split=args.split,
+                                              reprocess=args.force))
+
+
+def plan_once(args) -> int:
+    plan = plan_faire_orders(args.files, args.outlet, split=args.split)
+    print(f"Planned in {plan.get('seconds', 0):.2f}s without API calls.")
+    if args.out:
+        save_plan(plan, args.out)
+        print(f"Plan saved to {args.out}; run `apply {args.out}` to carry it out.")
+    return 0 if plan["orders"] else 1
+
+
+def apply_once(args) -> int:
+    return print_summary(apply_plan(load_plan(args.plan), reprocess=args.force))
+
+
+class FolderWatcher:
+    """
+    Polls a folder for Faire CSVs and feeds them to worker threads.
+
+    A file is only picked up once its size has stopped changing between two
+    polls, so half-copied exports are left alone.
+    """
+    def __init__(self, folder: str, outlet_id: str, workers: int = 2, interval: float = 5.0,
+                 registry_ttl: int = 900, sync: bool = False, split: dict = None, reprocess: bool = False):
+        self.folder = os.path.abspath(folder)
+        self.outlet_id = outlet_id
+        self.split = split
+        self.workers = workers
+        self.interval = interval
+        self.sync = sync
+        self.reprocess = reprocess
+        self.processed_dir = os.path.join(self.folder, "processed")
+        self.failed_dir = os.path.join(self.folder, "failed")
+        # One registry for the whole daemon; it reloads itself once older than the ttl
+        self.registry = SupplierBrandRegistry(ttl=registry_ttl)
+        self.queue = queue.Queue(maxsize=workers * 2)
+        self.stop_event = threading.Event()
+        self.seen_sizes = {}
+        self.in_progress = set()
+        self.lock = threading.Lock()
+
+    def log(self, message: str):
+        print(f"[{datetime.now():%Y-%m-%d %H:%M:%S}] {message}", flush=True)
+
+    def scan(self):
+        entries = []
+        for entry in os.scandir(self.folder):
+            # A file can be moved or deleted between listing it and reading its stats
+            try:
+                if entry.is_file() and entry.name.lower().endswith(".csv"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, entry.path, stat.st_size))
+            except OSError:
+                continue
+        for _, path, size in sorted(entries):
+            with self.lock:
+                if path in self.in_progress:
+                    continue
+                stable = self.seen_sizes.get(path) == size
+                self.seen_sizes[path] = size
+                if not stable:
+                    continue
+                self.in_progress.add(path)
+            # Blocks when the workers are busy, which keeps the backlog bounded
+            self.queue.put(path)
+
+    def refresh_registry(self):
+        with self.registry.lock:
+            if self.registry.loaded_at and time.time() - self.registry.loaded_at > self.registry.ttl:
+                self.registry.load(force=True)
+
+    def worker(self):
+        while not self.stop_event.is_set():
+            try:
+                path = self.queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            name = os.path.basename(path)
+            try:
+                self.refresh_registry()
+                # Tag pipeline messages with the file name so interleaved workers stay readable
+                result = process_faire_order(path, self.outlet_id, registry=self.registry, sync=self.sync,
+                                             split=self.split, reprocess=self.reprocess,
+                                             log=lambda m: self.log(m if name in m else f"{name}: {m}"))
+                ok = not result.get("error") and not result.get("failed")
+            except Exception as e:
+                self.log(f"❌ {name}: {e}")
+                ok = False
+            self.move(path, self.processed_dir if ok else self.failed_dir)
+            with self.lock:
+                self.in_progress.discard(path)
+                self.seen_sizes.pop(path, None)
+            self.queue.task_done()
+
+    def move(self, path: str, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        stem, ext = os.path.splitext(os.path.basename(path))
+        target = os.path.join(directory, f"{stem}-{datetime.now():%Y%m%d-%H%M%S}{ext}")
+        try:
+            shutil.move(path, target)
+            self.log(f"Moved {os.path.basename(path)} to {os.path.relpath(target, self.folder)}")
+        except OSError as e:
+            self.log(f"⚠️ Could not move {path}: {e}")
+
+    def run(self):
+        self.log(f"Watching {self.folder} with {self.workers} workers (every {self.interval:g}s)")
+        threads = [threading.Thread(target=self.worker, daemon=True) for _ in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        try:
+            while not self.stop_event.is_set():
+                self.scan()
+                self.stop_event.wait(self.interval)
+        except KeyboardInterrupt:
+            self.log("Stopping after the orders in progress...")
+        finally:
+            self.queue.join()
+            self.stop_event.set()
+            for thread in threads:
+                thread.join()
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Create Lightspeed stock orders from Faire order CSVs.")
+    parser.add_argument("--outlet", default=os.getenv("OUTLET_ID"), help="Lightspeed outlet id (default: OUTLET_ID).")
+    parser.add_argument("--split", default=os.getenv("FAIRE_OUTLET_SPLIT"),
+                        help="Share orders between outlets: 'outlet_id=ratio|column,...' or a CSV table "
+                             "(default: FAIRE_OUTLET_SPLIT).")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Process the given CSV files once and exit.")
+    run_parser.add_argument("files", nargs="+")
+    run_parser.add_argument("--sync", action="store_true",
+                            help="Update each order's open stock order instead of creating a new one.")
+    run_parser.add_argument("--force", action="store_true",
+                            help="Process orders again even if they were already completed.")
+
+    plan_parser = subparsers.add_parser("plan", help="Preview what a run would do, without API calls.")
+    plan_parser.add_argument("files", nargs="+")
+    plan_parser.add_argument("--out", help="Save the plan as JSON for `apply`.")
+
+    apply_parser = subparsers.add_parser("apply", help="Carry out a plan saved by `plan --out`.")
+    apply_parser.add_argument("plan")
+    apply_parser.add_argument("--force", action="store_true",
+                              help="Apply orders again even if they were already completed.")
+
+    watch_parser = subparsers.add_parser("watch", help="Keep processing CSVs dropped into a folder.")
+    watch_parser.add_argument("folder")
+    watch_parser.add_argument("--workers", type=int, default=2, help="Orders processed at the same time.")
+    watch_parser.add_argument("--interval", type=float, default=5.0, help="Seconds between folder scans.")
+    watch_parser.add_argument("--registry-ttl", type=int, default=900,
+                              help="Seconds before the supplier/brand lists are reloaded.")
+    watch_parser.add_argument("--sync", action="store_true",
+                              help="Revised orders update their open stock order instead of creating a new one.")
+    watch_parser.add_argument("--force", action="store_true",
+                              help="Process a dropped file again even if that order was already completed.")
+
+    args = parser.parse_args(argv)
+    if args.command == "apply":
+        # The outlet is part of the plan
+        return apply_once(args)
+    try:
+        args.split = load_outlet_split(args.split)
+    except (OSError, ValueError) as e:
+        parser.error(f"Invalid outlet split: {e}")
+    if not args.outlet and not args.split:
+        parser.error("OUTLET_ID environment variable not set (or pass --outlet).")
+
+    if args.command == "run":
+        return run_once(args)
+    if args.command == "plan":
+        return plan_once(args)
+
+    os.makedirs(args.folder, exist_ok=True)
+    FolderWatcher(args.folder, args.outlet, workers=args.workers, interval=args.interval,
+                  registry_ttl=args.registry_ttl, sync=args.sync, split=args.split, reprocess=args.force).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
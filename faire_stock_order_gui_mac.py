@@ -1,10 +1,10 @@
+import time
+STARTED = time.perf_counter()
 import tkinter as tk
 from tkinter import filedialog, messagebox, scrolledtext, ttk
-import pandas as pd
 import os
 import sys
 import threading
-import time
 from dotenv import load_dotenv
 def get_env_path():
     # If running from PyInstaller bundle
@@ -16,14 +16,12 @@ def get_env_path():
         return os.path.abspath(".env")  # dev mode fallback
 
 load_dotenv(dotenv_path=get_env_path())
-from faireOrderFuncs import (
-    save_all_products_CSV, get_all_products, build_stock_order_lines,
-    add_products_to_stock_order, create_missing_products, combine_product_ids,
-    create_stock_order_shell, read_faire_order, read_products_csv,
-    match_products_and_find_missing
-)
 
-TEMP_PRODUCTS_FILE = "tempProductsFile.csv"
+# pandas/requests (via faireOrderFuncs) take seconds to import, so they are
+# loaded in the background once the window is up instead of before it.
+def load_pipeline():
+    import faireOrderFuncs
+    return faireOrderFuncs
 
 class FaireStockOrderApp:
     def __init__(self, root):
@@ -31,92 +29,107 @@ class FaireStockOrderApp:
         self.root.title("Faire to Lightspeed Stock Order")
         self.root.geometry("600x450")
 
-        self.label = tk.Label(root, text="Upload Faire Order CSV:")
+        self.label = tk.Label(root, text="Upload Faire Order CSV(s):")
         self.label.pack(pady=10)
 
-        self.upload_button = tk.Button(root, text="Choose File", command=self.choose_file)
+        self.upload_button = tk.Button(root, text="Choose File(s)", command=self.choose_file)
         self.upload_button.pack(pady=5)
 
+        self.preview_button = tk.Button(root, text="Preview (no changes)", command=self.start_preview_thread, state=tk.DISABLED)
+        self.preview_button.pack(pady=5)
+
         self.run_button = tk.Button(root, text="Run Stock Order Process", command=self.start_process_thread, state=tk.DISABLED)
         self.run_button.pack(pady=10)
 
+        # Orders already completed are skipped unless this is ticked
+        self.reprocess = tk.BooleanVar(value=False)
+        self.reprocess_check = tk.Checkbutton(root, text="Reprocess orders already completed", variable=self.reprocess)
+        self.reprocess_check.pack(pady=2)
+
         self.progress = ttk.Progressbar(root, mode="indeterminate")
         self.progress.pack(fill=tk.X, padx=10, pady=5)
 
         self.log_output = scrolledtext.ScrolledText(root, wrap=tk.WORD, height=15)
         self.log_output.pack(padx=10, pady=10, fill=tk.BOTH, expand=True)
 
-        self.csv_path = None
+        self.csv_paths = []
+        self.root.after_idle(self.window_ready)
+
+    def window_ready(self):
+        self.startup_seconds = time.perf_counter() - STARTED
+        self.log(f"Ready in {self.startup_seconds:.2f}s")
+        if "--startup-probe" in sys.argv:
+            # Used by bench_startup.py to time the cold start
+            print(f"startup_seconds={self.startup_seconds:.4f}", flush=True)
+            self.root.after(0, self.root.destroy)
+            return
+        threading.Thread(target=load_pipeline, daemon=True).start()
 
     def log(self, message):
         self.log_output.insert(tk.END, f"{message}\n")
         self.log_output.see(tk.END)
 
     def choose_file(self):
-        file_path = filedialog.askopenfilename(filetypes=[("CSV Files", "*.csv")])
-        if file_path:
-            self.csv_path = file_path
-            self.log(f"Selected file: {file_path}")
+        file_paths = filedialog.askopenfilenames(filetypes=[("CSV Files", "*.csv")])
+        if file_paths:
+            self.csv_paths = list(file_paths)
+            for file_path in self.csv_paths:
+                self.log(f"Selected file: {file_path}")
             self.run_button.config(state=tk.NORMAL)
+            self.preview_button.config(state=tk.NORMAL)
 
     def start_process_thread(self):
         thread = threading.Thread(target=self.run_process)
         thread.start()
 
-    def run_process(self):
+    def start_preview_thread(self):
+        thread = threading.Thread(target=self.run_preview)
+        thread.start()
+
+    def run_preview(self):
         self.progress.start()
         try:
             OUTLET_ID = os.getenv("OUTLET_ID")
-            if not OUTLET_ID:
-                raise ValueError("OUTLET_ID environment variable not set.")
-
-            self.log("Saving current Lightspeed products...")
-
-            # Progress bar is running while downloading
-            save_all_products_CSV(get_all_products(), TEMP_PRODUCTS_FILE)
-
-            self.log("Reading Faire and Lightspeed product data...")
-            faireDF = read_faire_order(self.csv_path)
-            productsDF = read_products_csv(TEMP_PRODUCTS_FILE)
-
-            self.log("Matching products...")
-            existing_products_df, missing_products_df = match_products_and_find_missing(productsDF, faireDF)
 
-            self.log(f"Found {len(missing_products_df)} missing products. Creating them...")
-            created_products = create_missing_products(missing_products_df)
-
-            self.log("Combining matched and newly created product data...")
-            combined_df = combine_product_ids(existing_products_df, created_products)
-
-            self.log("Creating stock order shell...")
-            stock_order = create_stock_order_shell(location_id=OUTLET_ID, faire_df=faireDF)
+            # Uses only the local catalog and saved supplier/brand list; nothing is sent to Lightspeed
+            funcs = load_pipeline()
+            split = funcs.load_outlet_split(funcs.OUTLET_SPLIT)
+            if not OUTLET_ID and not split:
+                raise ValueError("OUTLET_ID environment variable not set.")
+            funcs.plan_faire_orders(self.csv_paths, OUTLET_ID, log=self.log, split=split)
 
-            if stock_order and "id" in stock_order:
-                stock_order_id = stock_order["id"]
-                self.log(f"Stock order created with ID: {stock_order_id}")
+        except Exception as e:
+            self.log(f"❌ Error: {e}")
+            messagebox.showerror("Error", str(e))
+        finally:
+            self.progress.stop()
 
-                self.log("Building line items...")
-                line_items = build_stock_order_lines(combined_df)
+    def run_process(self):
+        self.progress.start()
+        try:
+            OUTLET_ID = os.getenv("OUTLET_ID")
+            funcs = load_pipeline()
+            # FAIRE_OUTLET_SPLIT shares each order between several outlets instead
+            split = funcs.load_outlet_split(funcs.OUTLET_SPLIT)
+            if not OUTLET_ID and not split:
+                raise ValueError("OUTLET_ID environment variable not set.")
 
-                self.log("Adding products to stock order...")
-                add_products_to_stock_order(stock_order_id, line_items)
+            # Catalog and suppliers/brands are loaded once for all selected orders
+            summary = funcs.process_faire_orders(self.csv_paths, OUTLET_ID, log=self.log, split=split,
+                                                 reprocess=self.reprocess.get())
 
-                self.log("✅ Stock order completed successfully.")
-            else:
-                self.log("❌ Failed to create stock order.")
+            if len(self.csv_paths) > 1:
+                self.log(f"Batch finished: {funcs.format_batch_summary(summary)}")
+            if summary["report"]:
+                self.log(f"⏱ {summary['report']}")
+            if summary["report_path"]:
+                self.log(f"Run report saved to {summary['report_path']}")
 
         except Exception as e:
             self.log(f"❌ Error: {e}")
             messagebox.showerror("Error", str(e))
         finally:
             self.progress.stop()
-            # Clean up temp file
-            try:
-                if os.path.exists(TEMP_PRODUCTS_FILE):
-                    os.remove(TEMP_PRODUCTS_FILE)
-                    self.log("🧹 Temporary products file deleted.")
-            except Exception as cleanup_error:
-                self.log(f"⚠️ Could not delete temp file: {cleanup_error}")
 
 if __name__ == "__main__":
     root = tk.Tk()
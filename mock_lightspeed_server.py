@@ -0,0 +1,317 @@
+"""
+Local stand-in for the parts of the Lightspeed X-Series 2.0 API that
+faireOrderFuncs uses, for benchmarks and offline experiments.
+
+Implements version-paginated /products, /suppliers, /brands and /inventory,
+/search, product/supplier/brand creation, consignments and consignment
+product lines. Latency per request and a simple rate limit (answered with
+429 + Retry-After) can be configured. Every request is counted per endpoint.
+"""
+import bisect
+import itertools
+import json
+import re
+import socket
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+API_PREFIX = "/api/2.0"
+
+
+class _VersionedCollection:
+    """
+    Records kept in version order, so ?after= pagination is a bisect.
+    """
+    def __init__(self, counter):
+        self._counter = counter
+        self.versions = []
+        self.records = []
+        self.by_id = {}
+
+    def add(self, record: dict) -> dict:
+        record["version"] = next(self._counter)
+        self.versions.append(record["version"])
+        self.records.append(record)
+        self.by_id[record["id"]] = record
+        return record
+
+    def page(self, after: int, page_size: int, include_deleted: bool = False) -> list:
+        start = bisect.bisect_right(self.versions, after)
+        page = []
+        for record in itertools.islice(self.records, start, None):
+            if record.get("deleted_at") and not include_deleted:
+                continue
+            page.append(record)
+            if len(page) == page_size:
+                break
+        return page
+
+
+class MockLightspeed:
+    """
+    In-memory Lightspeed store served over HTTP on localhost.
+
+    Args:
+        latency (float): Seconds added to every request.
+        rate_limit (float): Requests per second allowed before answering 429 (0 = unlimited).
+        retry_after (int): Retry-After seconds sent with a 429.
+        page_size (int): Records per page of a paginated collection.
+    """
+    def __init__(self, latency: float = 0.0, rate_limit: float = 0.0, retry_after: int = 1, page_size: int = 1000):
+        self.latency = latency
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.page_size = page_size
+        self.lock = threading.Lock()
+        self._versions = itertools.count(1)
+        self.products = _VersionedCollection(self._versions)
+        self.suppliers = _VersionedCollection(self._versions)
+        self.brands = _VersionedCollection(self._versions)
+        self.inventory = _VersionedCollection(self._versions)
+        self.consignments = {}
+        self.consignment_products = {}
+        self.request_counts = Counter()
+        self.status_counts = Counter()
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self.server = None
+        self.thread = None
+
+    # ---- data setup -------------------------------------------------------
+
+    def add_brand(self, name: str) -> dict:
+        with self.lock:
+            return self.brands.add({"id": str(uuid.uuid4()), "name": name, "deleted_at": None})
+
+    def add_supplier(self, name: str) -> dict:
+        with self.lock:
+            return self.suppliers.add({"id": str(uuid.uuid4()), "name": name, "description": name, "deleted_at": None})
+
+    def add_product(self, name: str, supplier_code: str, brand: dict = None, supplier: dict = None,
+                    supply_price: float = 0.0, outlet_id: str = None) -> dict:
+        with self.lock:
+            return self._add_product_locked({
+                "name": name,
+                "supplier_code": supplier_code,
+                "brand_id": brand["id"] if brand else None,
+                "supplier_id": supplier["id"] if supplier else None,
+                "supply_price": supply_price,
+                "inventory": [{"outlet_id": outlet_id, "current_amount": 0}] if outlet_id else [],
+            })
+
+    def _add_product_locked(self, payload: dict) -> dict:
+        brand = self.brands.by_id.get(payload.get("brand_id"))
+        product = self.products.add({
+            "id": str(uuid.uuid4()),
+            "name": payload.get("name"),
+            "sku": f"sku-{len(self.products.records) + 1}",
+            "supplier_code": payload.get("supplier_code"),
+            "brand_id": payload.get("brand_id"),
+            "brand": {"id": brand["id"], "name": brand["name"]} if brand else None,
+            "supplier_id": payload.get("supplier_id"),
+            "supply_price": payload.get("supply_price"),
+            "price_excluding_tax": payload.get("price_excluding_tax"),
+            # Typical product payloads carry far more than the matcher needs
+            "variant_options": [],
+            "tag_ids": [],
+            "images": [],
+            "description": "",
+            "deleted_at": None,
+        })
+        for level in payload.get("inventory") or []:
+            self.inventory.add({
+                "id": str(uuid.uuid4()),
+                "product_id": product["id"],
+                "outlet_id": level.get("outlet_id"),
+                "inventory_level": level.get("current_amount", 0),
+                "current_amount": level.get("current_amount", 0),
+                "deleted_at": None,
+            })
+        return product
+
+    def set_inventory(self, product_id: str, outlet_id: str, level: int) -> dict:
+        with self.lock:
+            return self.inventory.add({
+                "id": str(uuid.uuid4()),
+                "product_id": product_id,
+                "outlet_id": outlet_id,
+                "inventory_level": level,
+                "current_amount": level,
+                "deleted_at": None,
+            })
+
+    # ---- server -----------------------------------------------------------
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}{API_PREFIX}"
+
+    def start(self) -> "MockLightspeed":
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _make_handler(self))
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def total_requests(self) -> int:
+        with self.lock:
+            return sum(self.request_counts.values())
+
+    def _throttled(self) -> bool:
+        if not self.rate_limit:
+            return False
+        with self.lock:
+            now = time.monotonic()
+            if now - self._window_start >= 1.0:
+                self._window_start = now
+                self._window_count = 0
+            self._window_count += 1
+            return self._window_count > self.rate_limit
+
+    # ---- request handling -------------------------------------------------
+
+    def handle(self, method: str, path: str, query: dict, body: dict) -> tuple:
+        """
+        Returns (status, response body) for one API request.
+        """
+        if not path.startswith(API_PREFIX):
+            return 404, {"error": "not found"}
+        parts = [p for p in path[len(API_PREFIX):].split("/") if p]
+        endpoint = f"{method} /" + "/".join("{id}" if i % 2 else part for i, part in enumerate(parts))
+        with self.lock:
+            self.request_counts[endpoint] += 1
+
+        if self.latency:
+            time.sleep(self.latency)
+        if self._throttled():
+            return 429, {"error": "rate limited"}
+
+        collections = {"products": self.products, "suppliers": self.suppliers,
+                       "brands": self.brands, "inventory": self.inventory}
+        with self.lock:
+            if method == "GET" and len(parts) == 1 and parts[0] in collections:
+                after = int(query.get("after", ["0"])[0] or 0)
+                page_size = int(query.get("page_size", [self.page_size])[0])
+                include_deleted = query.get("deleted", ["false"])[0] == "true"
+                page = collections[parts[0]].page(after, page_size, include_deleted)
+                version = {"min": page[0]["version"], "max": page[-1]["version"]} if page else None
+                return 200, {"data": page, "version": version}
+
+            if method == "GET" and parts == ["search"]:
+                # Case-insensitive substring match, like the real search endpoint
+                q = query.get("q", [""])[0].strip().casefold()
+                hits = [p for p in self.products.records
+                        if not p.get("deleted_at") and q and q in (p.get("supplier_code") or "").casefold()]
+                return 200, {"data": hits[:100]}
+
+            if method == "POST" and parts == ["products"]:
+                product = self._add_product_locked(body)
+                return 201, {"data": [product["id"]]}
+
+            if method == "POST" and parts in (["suppliers"], ["brands"]):
+                collection = collections[parts[0]]
+                record = collection.add({"id": str(uuid.uuid4()), "name": body.get("name"),
+                                         "description": body.get("description"), "deleted_at": None})
+                return 201, {"data": record}
+
+            if method == "GET" and parts == ["consignments"]:
+                wanted = {key: values[0] for key, values in query.items() if key in ("type", "status")}
+                found = [c for c in self.consignments.values()
+                         if all(str(c.get(key)) == value for key, value in wanted.items())]
+                return 200, {"data": found}
+
+            if method == "GET" and len(parts) == 2 and parts[0] == "consignments":
+                consignment = self.consignments.get(parts[1])
+                return (200, {"data": consignment}) if consignment else (404, {"error": "consignment not found"})
+
+            if method == "POST" and parts == ["consignments"]:
+                consignment = {"id": str(uuid.uuid4()), **body}
+                self.consignments[consignment["id"]] = consignment
+                self.consignment_products[consignment["id"]] = {}
+                return 201, {"data": consignment}
+
+            if len(parts) >= 3 and parts[0] == "consignments" and parts[2] == "products":
+                lines = self.consignment_products.get(parts[1])
+                if lines is None:
+                    return 404, {"error": "consignment not found"}
+                if method == "GET" and len(parts) == 3:
+                    return 200, {"data": list(lines.values())}
+                if method == "POST" and len(parts) == 3:
+                    line = {"product_id": body.get("product_id"), "count": body.get("count"), "cost": body.get("cost")}
+                    lines[line["product_id"]] = line
+                    return 201, {"data": line}
+                if len(parts) == 4 and parts[3] in lines:
+                    if method == "PUT":
+                        lines[parts[3]].update({k: v for k, v in body.items() if k in ("count", "cost")})
+                        return 200, {"data": lines[parts[3]]}
+                    if method == "DELETE":
+                        del lines[parts[3]]
+                        return 204, None
+                return 404, {"error": "line not found"}
+
+        return 404, {"error": f"unsupported endpoint {endpoint}"}
+
+
+def _make_handler(mock: MockLightspeed):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self):
+            super().setup()
+            # Headers and body go out in separate writes; don't let Nagle delay the body
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        def log_message(self, format, *args):
+            pass
+
+        def _dispatch(self, method):
+            url = urlparse(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b""
+            try:
+                body = json.loads(raw) if raw else {}
+            except ValueError:
+                body = {}
+            status, payload = mock.handle(method, re.sub(r"/+$", "", url.path), parse_qs(url.query), body)
+            with mock.lock:
+                mock.status_counts[status] += 1
+
+            data = json.dumps(payload).encode() if payload is not None else b""
+            self.send_response(status)
+            if status == 429:
+                self.send_header("Retry-After", str(mock.retry_after))
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+        def do_PUT(self):
+            self._dispatch("PUT")
+
+        def do_DELETE(self):
+            self._dispatch("DELETE")
+
+    return Handler